@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# === Nearest-neighbour indexes over an embedding store ===
+# FlatIndex scores every row (exact). IVFIndex clusters the rows with
+# spherical k-means and, per query, only scores the rows in the `nprobe`
+# clusters whose centroids are closest: raising nprobe trades latency for
+# recall (nprobe == nlist is exact). Both take L2-normalised queries and
+# return [(row, cosine), ...] best first.
+#
+#     python ann_index.py eval data/vector_store --nprobe 1 4 8 16
+
+DEFAULT_NPROBE = int(os.getenv("ALGOMATE_ANN_NPROBE", "8"))
+AUTO_IVF_MIN_ROWS = 4096   # below this a flat scan is already sub-millisecond
+ASSIGN_CHUNK_ROWS = 16384
+
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ORDER_FILE = "ivf_order.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+
+
+def top_k(scores, top_n, threshold=None):
+    """Best `top_n` (index, score) pairs of a score vector, without sorting all of it."""
+    if top_n <= 0:
+        return []
+    if threshold is not None:
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    if len(candidates) > top_n:
+        candidates = candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]]
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return [(int(i), float(scores[i])) for i in order]
+
+
+def top_k_rows(scores, top_n, threshold=None):
+    """top_k for every row of a (queries, rows) score matrix, vectorised with argpartition."""
+    k = min(top_n, scores.shape[1])
+    if k <= 0:
+        return [[] for _ in range(len(scores))]
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    return [
+        [(int(i), float(s)) for i, s in zip(rows, row_scores) if threshold is None or s >= threshold]
+        for rows, row_scores in zip(best, best_scores)
+    ]
+
+
+class FlatIndex:
+    kind = "flat"
+    QUERY_CHUNK = 256   # bounds the (queries, rows) score matrix
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def search(self, query, top_n=5, threshold=None, nprobe=None):
+        return top_k(self.embeddings @ query, top_n, threshold)
+
+    def search_batch(self, queries, top_n=5, threshold=None, nprobe=None):
+        results = []
+        for start in range(0, len(queries), self.QUERY_CHUNK):
+            scores = queries[start:start + self.QUERY_CHUNK] @ self.embeddings.T
+            results.extend(top_k_rows(np.asarray(scores, dtype=np.float32), top_n, threshold))
+        return results
+
+
+def assign_clusters(matrix, centroids):
+    """Nearest centroid per row, computed in chunks so a memory-mapped matrix is never fully loaded."""
+    assignment = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(matrix[start:start + ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, embeddings, centroids, order, offsets, nprobe=DEFAULT_NPROBE):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, iterations=10, train_size=65536, seed=0):
+        """Spherical k-means over (a sample of) the rows, then one inverted list per centroid."""
+        n = len(embeddings)
+        nlist = max(1, min(nlist or int(np.sqrt(n)), n))
+        rng = np.random.default_rng(seed)
+
+        train = np.asarray(embeddings[np.sort(rng.choice(n, min(n, train_size), replace=False))], dtype=np.float32)
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = assign_clusters(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, train)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Empty clusters keep their previous centroid
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        assignment = assign_clusters(embeddings, centroids)
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))]).astype(np.int64)
+        return cls(embeddings, centroids, order, offsets)
+
+    def save(self, path):
+        np.save(os.path.join(path, IVF_CENTROIDS_FILE), self.centroids)
+        np.save(os.path.join(path, IVF_ORDER_FILE), self.order)
+        np.save(os.path.join(path, IVF_OFFSETS_FILE), self.offsets)
+
+    @classmethod
+    def load(cls, path, embeddings):
+        return cls(
+            embeddings,
+            np.load(os.path.join(path, IVF_CENTROIDS_FILE)),
+            np.load(os.path.join(path, IVF_ORDER_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, IVF_OFFSETS_FILE)),
+        )
+
+    def search(self, query, top_n=5, threshold=None, nprobe=None):
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        probes = top_k(self.centroids @ query, nprobe)
+        rows = np.sort(np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c, _ in probes]))
+        if not len(rows):
+            return []
+        # Fancy indexing reads only the probed rows from the memory-mapped matrix
+        scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+        return [(int(rows[i]), score) for i, score in top_k(scores, top_n, threshold)]
+
+    def search_batch(self, queries, top_n=5, threshold=None, nprobe=None):
+        # Each query probes its own clusters, so there is no shared matrix product
+        return [self.search(query, top_n, threshold, nprobe) for query in queries]
+
+
+def build_index(embeddings, kind="auto", nlist=None):
+    """Builds the index named by `kind` ("flat", "ivf", or "auto" by corpus size)."""
+    if kind == "auto":
+        kind = "ivf" if len(embeddings) >= AUTO_IVF_MIN_ROWS else "flat"
+    if kind == "ivf":
+        return IVFIndex.build(embeddings, nlist=nlist)
+    if kind == "flat":
+        return FlatIndex(embeddings)
+    raise ValueError(f"Unknown index kind: {kind}")
+
+
+def load_index(path, embeddings, meta):
+    """The index recorded in a store's meta.json (flat when none was built)."""
+    if meta.get("index") == "ivf" and os.path.exists(os.path.join(path, IVF_CENTROIDS_FILE)):
+        return IVFIndex.load(path, embeddings)
+    return FlatIndex(embeddings)
+
+
+# === Recall / latency report ===
+
+def evaluate(path, nprobes, queries=200, top_n=5, seed=0):
+    """Recall@top_n of the store's index against an exact scan, using stored rows as queries."""
+    from embedding_store import EmbeddingStore
+
+    store = EmbeddingStore.open(path)
+    exact = FlatIndex(store.embeddings)
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(store), min(queries, len(store)), replace=False)
+    query_vectors = np.asarray(store.embeddings[np.sort(rows)], dtype=np.float32)
+    truth = [{row for row, _ in exact.search(q, top_n)} for q in query_vectors]
+
+    report = []
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = [{row for row, _ in store.index.search(q, top_n, nprobe=nprobe)} for q in query_vectors]
+        elapsed = time.perf_counter() - start
+        recall = sum(len(f & t) for f, t in zip(found, truth)) / max(1, sum(len(t) for t in truth))
+        report.append({
+            "index": store.index.kind,
+            "nprobe": nprobe,
+            "recall": round(recall, 4),
+            "mean_latency_ms": round(elapsed * 1000 / len(query_vectors), 4),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ANN recall and latency on an embedding store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("eval")
+    report.add_argument("store")
+    report.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    report.add_argument("--queries", type=int, default=200)
+    report.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "eval":
+        if not os.path.isdir(args.store):
+            print(f"No store at {args.store}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(evaluate(args.store, args.nprobe, args.queries, args.top_n), indent=2))
+
+
+if __name__ == "__main__":
+    main()
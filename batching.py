@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from inference_server import RequestCancelled
+
+# === Dynamic micro-batching for local generation ===
+# Requests that arrive within ALGOMATE_BATCH_MAX_WAIT_MS of each other are
+# collected (up to ALGOMATE_BATCH_MAX_SIZE) and handed to one `run_batch`
+# call, so several editor windows sharing one SLM host share one `generate`.
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("ALGOMATE_BATCH_MAX_SIZE", "4"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("ALGOMATE_BATCH_MAX_WAIT_MS", "10"))
+
+
+class BatchScheduler:
+    """
+    Collects items submitted from many threads and runs them in batches.
+
+    `run_batch(items, contexts)` must return one result per item, in order.
+    `submit` blocks the calling worker until its item's result is ready.
+    """
+
+    def __init__(self, run_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, name="batch"):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item, ctx=None):
+        future = Future()
+        self._queue.put((item, ctx, future))
+        self._start()
+        return future.result()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"{self.name}-scheduler", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        # Block for the first item, then keep the window open for stragglers.
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            live = []
+            for item, ctx, future in self._collect():
+                # Requests superseded while queued never reach the model.
+                if ctx is not None and ctx.cancelled:
+                    future.set_exception(RequestCancelled())
+                else:
+                    live.append((item, ctx, future))
+            if not live:
+                continue
+
+            try:
+                results = self.run_batch([item for item, _, _ in live], [ctx for _, ctx, _ in live])
+            except BaseException as e:
+                print(f"Error in {self.name} batch of {len(live)}: {str(e)}", file=sys.stderr)
+                for _, _, future in live:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(live)
+            for (_, _, future), result in zip(live, results):
+                future.set_result(result)
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tracemalloc
+
+# === Retrieval benchmark ===
+# Replays a fixed query set against an embedding store through each retrieval
+# backend and reports per-query p50/p95 latency, peak allocations and
+# recall@k against an exact brute-force cosine scan of the same store:
+#
+#   exact    brute-force cosine over every row (the reference)
+#   index    the store's own nearest-neighbour index (flat or IVF, --nprobe)
+#   cascade  BM25 candidates reranked by cosine (retrieval.cascade_search)
+#   bm25     BM25 alone, the keyword ranking the codegen script falls back to
+#
+# Queries come from data/samples.jsonl (a held-out tail) and any --queries
+# files: .jsonl records with an instruction/prompt/title, or plain lines.
+# Query embeddings are computed once up front, so dense latencies are for the
+# search alone. --min-recall makes the run fail on a regression:
+#
+#     python bench_retrieval.py --queries requests.jsonl --top-n 5 --json --min-recall 0.9
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKENDS = ["exact", "index", "cascade", "bm25"]
+QUERY_FIELDS = ("instruction", "prompt", "title")
+
+
+def load_queries(path, limit=None, tail=False):
+    """Query texts of a .jsonl (first of QUERY_FIELDS) or plain-text file; `tail` takes the last `limit`."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                line = next((record[field].strip() for field in QUERY_FIELDS if record.get(field)), "")
+            if line:
+                queries.append(line)
+    if limit is not None:
+        queries = queries[-limit:] if tail else queries[:limit]
+    return queries
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def max_rss_mb():
+    """Peak resident memory of this process, or None where `resource` is unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def backend_search(name, store, top_n, nprobe, candidates):
+    """search(query text, query embedding) -> [row, ...] for one backend."""
+    from ann_index import FlatIndex
+    from retrieval import cascade_search
+
+    if name == "exact":
+        exact = FlatIndex(store.embeddings)
+        return lambda text, query: [row for row, _ in exact.search(query, top_n)]
+    if name == "index":
+        return lambda text, query: [row for row, _ in store.index.search(query, top_n, nprobe=nprobe)]
+    if name == "cascade":
+        return lambda text, query: [
+            row for row, _ in cascade_search(text, query, store, top_n, None, nprobe, candidates)
+        ]
+    if name == "bm25":
+        return lambda text, query: [row for row, _ in store.lexical.search(text, top_n)]
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def run_backend(name, store, texts, queries, truth, top_n, nprobe, candidates):
+    search = backend_search(name, store, top_n, nprobe, candidates)
+    # Warm-up: loads lazy state (the lexical index, IVF lists) outside the timing
+    start = time.perf_counter()
+    search(texts[0], queries[0])
+    setup_ms = (time.perf_counter() - start) * 1000
+
+    timings, found = [], []
+    for text, query in zip(texts, queries):
+        start = time.perf_counter()
+        found.append(search(text, query))
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Allocations are traced in a separate pass: tracemalloc slows every
+    # Python allocation, which would penalise the pure-Python backends' timings
+    tracemalloc.start()
+    for text, query in zip(texts, queries):
+        search(text, query)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    hits = sum(len(set(rows) & set(expected)) for rows, expected in zip(found, truth))
+    return {
+        "backend": name,
+        "queries": len(texts),
+        "top_n": top_n,
+        f"recall_at_{top_n}": round(hits / max(1, sum(len(expected) for expected in truth)), 4),
+        "p50_ms": round(percentile(timings, 0.50), 4),
+        "p95_ms": round(percentile(timings, 0.95), 4),
+        "setup_ms": round(setup_ms, 2),
+        "peak_alloc_mb": round(peak / 2**20, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and recall@k of the retrieval backends on a fixed query set.")
+    parser.add_argument("--store", default=os.path.join(SCRIPT_DIR, "data", "vector_store"))
+    parser.add_argument("--samples", default=os.path.join(SCRIPT_DIR, "data", "samples.jsonl"))
+    parser.add_argument("--held-out", type=int, default=100, help="Instructions taken from the end of --samples")
+    parser.add_argument("--queries", action="append", default=[], help="Extra query file (.jsonl or text), repeatable")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--candidates", type=int, default=None, help="Cascade candidates (default ALGOMATE_RETRIEVAL_CANDIDATES)")
+    parser.add_argument("--min-recall", type=float, default=None, help="Exit non-zero if any backend but bm25 falls below this")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    from retrieval import get_samples, encode_queries
+
+    texts = []
+    if os.path.exists(args.samples) and args.held_out:
+        texts.extend(load_queries(args.samples, args.held_out, tail=True))
+    for path in args.queries:
+        texts.extend(load_queries(path))
+    store = get_samples(args.store) if os.path.isdir(args.store) else None
+    if not texts or store is None or not len(store):
+        print(f"Need queries and a non-empty store at {args.store}", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    queries = encode_queries(texts)
+    encode_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    exact = backend_search("exact", store, args.top_n, None, None)
+    truth = [exact(text, query) for text, query in zip(texts, queries)]
+    results = [
+        run_backend(name, store, texts, queries, truth, args.top_n, args.nprobe, args.candidates)
+        for name in args.backends
+    ]
+    report = {
+        "store": args.store,
+        "rows": len(store),
+        "index": store.index.kind,
+        "queries": len(texts),
+        "mean_encode_ms": round(encode_ms, 3),
+        "max_rss_mb": max_rss_mb(),
+        "results": results,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['rows']} rows ({report['index']} index), {report['queries']} queries, "
+              f"encode {report['mean_encode_ms']} ms/query, max RSS {report['max_rss_mb'] or '-'} MB")
+        for r in results:
+            print(f"{r['backend']:<8} recall@{args.top_n} {r[f'recall_at_{args.top_n}']:<7} p50 {r['p50_ms']} ms  "
+                  f"p95 {r['p95_ms']} ms  setup {r['setup_ms']} ms  peak {r['peak_alloc_mb']} MB")
+
+    if args.min_recall is not None:
+        failing = [r["backend"] for r in results
+                   if r["backend"] != "bm25" and r[f"recall_at_{args.top_n}"] < args.min_recall]
+        if failing:
+            print(f"Recall below {args.min_recall}: {', '.join(failing)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+# === Assisted-decoding benchmark ===
+# Runs the contract-generation path (inferenceSLM.generate_batch) over a few
+# instructions from data/samples.jsonl once per ALGOMATE_SPECULATIVE mode and
+# reports wall-clock new tokens per second, e.g. on CPU:
+#
+#     python bench_speculative.py --prompts 5 --modes off prompt_lookup draft --greedy --json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODES = ["off", "prompt_lookup", "draft"]
+
+
+def load_instructions(path, limit):
+    instructions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                instruction = json.loads(line).get("instruction", "").strip()
+            except json.JSONDecodeError:
+                continue
+            if instruction:
+                instructions.append(instruction)
+            if len(instructions) >= limit:
+                break
+    return instructions
+
+
+def run_mode(slm, generation, mode, suffixes):
+    generation.SPECULATIVE_MODE = mode
+    tokenizer = slm.registry.acquire(slm.MODEL_NAME).tokenizer
+    try:
+        # Warm-up: loads the draft model and builds lazy kernels outside the timing
+        slm.generate_batch(suffixes[:1], [None])
+
+        timings, tokens = [], 0
+        for suffix in suffixes:
+            start = time.perf_counter()
+            text = slm.generate_batch([suffix], [None])[0]
+            timings.append(time.perf_counter() - start)
+            tokens += len(tokenizer(text, add_special_tokens=False).input_ids)
+    finally:
+        slm.registry.release(slm.MODEL_NAME)
+
+    total = sum(timings)
+    return {
+        "mode": mode,
+        "prompts": len(suffixes),
+        "new_tokens": tokens,
+        "seconds": round(total, 2),
+        "tokens_per_second": round(tokens / total, 2) if total else None,
+        "median_latency_s": round(statistics.median(timings), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare plain and assisted generate throughput for contract generation.")
+    parser.add_argument("--samples", default=os.path.join(SCRIPT_DIR, "data", "samples.jsonl"))
+    parser.add_argument("--prompts", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--max-new-tokens", type=int, default=None)
+    parser.add_argument("--greedy", action="store_true", help="Disable sampling so every mode decodes the same text")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    import inferenceSLM as slm
+    import generation
+
+    if args.greedy:
+        slm.GENERATION_KWARGS = dict(slm.GENERATION_KWARGS, do_sample=False, temperature=None, top_k=None, top_p=None)
+    if args.max_new_tokens:
+        slm.GENERATION_KWARGS = dict(slm.GENERATION_KWARGS, max_new_tokens=args.max_new_tokens)
+
+    suffixes = [slm.build_prompt_suffix(instruction) for instruction in load_instructions(args.samples, args.prompts)]
+    if not suffixes:
+        print(f"No instructions found in {args.samples}", file=sys.stderr)
+        sys.exit(1)
+
+    results = [run_mode(slm, generation, mode, suffixes) for mode in args.modes]
+    baseline = next((r for r in results if r["mode"] == "off"), None)
+    if baseline and baseline["tokens_per_second"]:
+        for r in results:
+            r["speedup"] = round((r["tokens_per_second"] or 0) / baseline["tokens_per_second"], 2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"{r['mode']:<14} {r['tokens_per_second']:>8} tok/s  {r['new_tokens']:>6} tokens  "
+                  f"median {r['median_latency_s']}s  speedup {r.get('speedup', '-')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# === Startup-time benchmark ===
+# Times how long each backend script takes to answer a request that does not
+# need a model (a short dropdown prefix, an empty ghost prefix, an unknown
+# deploy action), plus the bare import time of the modules the extension
+# spawns. Runs that crash instead of answering are reported as failures and
+# left out of the timings. Run it before and after touching imports:
+#
+#     python bench_startup.py --repeat 5 --max-seconds 1.0 --json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+REQUEST_CASES = [
+    ("inferenceDropDown.py", {"prompt": "im"}),
+    ("inferenceGhost.py", {"prompt": ""}),
+    ("deploy.py", {"action": "noop"}),
+]
+
+IMPORT_CASES = [
+    "inference_server",
+    "retrieval",
+    "model_registry",
+    "inferenceDropDown",
+    "inferenceSLM",
+]
+
+
+def child_env():
+    env = dict(os.environ)
+    # The Gemini scripts refuse to start without a key; none is used for trivial requests.
+    env.setdefault("GEMINI_API_KEY", "startup-benchmark")
+    return env
+
+
+def answered(result):
+    """A run counts when it exits 0 or still answers with JSON (e.g. an {"error": ...} for a bad request)."""
+    if result.returncode == 0:
+        return True
+    try:
+        json.loads(result.stdout)
+    except ValueError:
+        return False
+    return True
+
+
+def time_command(args, stdin_text=""):
+    """(elapsed seconds, None) for a run that answered, else (elapsed seconds, error text)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        args, input=stdin_text, capture_output=True, text=True, cwd=SCRIPT_DIR, env=child_env()
+    )
+    elapsed = time.perf_counter() - start
+    if answered(result):
+        return elapsed, None
+    lines = result.stderr.strip().splitlines()
+    return elapsed, f"exit {result.returncode}: {lines[-1] if lines else 'no output'}"
+
+
+def measure(label, args, stdin_text, repeat):
+    # Failed runs (crashes, import errors) are reported, not timed: they
+    # usually exit early and would make the case look fast
+    timings, errors = [], []
+    for _ in range(repeat):
+        elapsed, error = time_command(args, stdin_text)
+        if error is None:
+            timings.append(elapsed)
+        else:
+            errors.append(error)
+    return {
+        "case": label,
+        "median_s": round(statistics.median(timings), 4) if timings else None,
+        "min_s": round(min(timings), 4) if timings else None,
+        "max_s": round(max(timings), 4) if timings else None,
+        "runs": len(timings),
+        "failures": len(errors),
+        "error": errors[-1] if errors else None,
+    }
+
+
+def run_benchmark(repeat):
+    results = [measure("python (baseline)", [sys.executable, "-c", "pass"], "", repeat)]
+    for module in IMPORT_CASES:
+        results.append(measure(f"import {module}", [sys.executable, "-c", f"import {module}"], "", repeat))
+    for script, request in REQUEST_CASES:
+        results.append(measure(f"{script} trivial request", [sys.executable, script], json.dumps(request), repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the backend scripts.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case (median is reported)")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Exit with status 1 if any case's median exceeds this")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per case")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeat)
+    for row in results:
+        if args.json:
+            print(json.dumps(row))
+        elif row["runs"]:
+            print(f"{row['case']:<40} median {row['median_s']:.3f}s  (min {row['min_s']:.3f}s, max {row['max_s']:.3f}s)")
+        else:
+            print(f"{row['case']:<40} no successful runs")
+
+    failed = [row for row in results if row["failures"]]
+    for row in failed:
+        print(f"Failed: {row['case']} failed {row['failures']} of {args.repeat} runs ({row['error']})", file=sys.stderr)
+    slow = []
+    if args.max_seconds is not None:
+        slow = [row for row in results if row["runs"] and row["median_s"] > args.max_seconds]
+        for row in slow:
+            print(f"Over budget: {row['case']} took {row['median_s']:.3f}s > {args.max_seconds:.3f}s", file=sys.stderr)
+    if failed or slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import re
+import sys
+import json
+import math
+import heapq
+import hashlib
+from collections import Counter, defaultdict
+
+# === BM25 inverted index for lexical retrieval ===
+# Postings (term -> [[doc, term frequency], ...]) are built once per corpus
+# and saved next to it, so a query only walks the posting lists of its own
+# terms. The saved index carries a fingerprint of the indexed texts and is
+# rebuilt automatically when the corpus changes.
+
+K1 = 1.5
+B = 0.75
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def fingerprint(texts):
+    digest = hashlib.sha256(f"{K1}:{B}".encode("utf-8"))
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class BM25Builder:
+    """Accumulates postings one document at a time, for corpora that are streamed rather than held in memory."""
+
+    def __init__(self):
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        self.digest = hashlib.sha256(f"{K1}:{B}".encode("utf-8"))
+
+    def add(self, text):
+        doc = len(self.doc_lengths)
+        terms = Counter(tokenize(text))
+        self.doc_lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            self.postings[term].append([doc, tf])
+        self.digest.update(text.encode("utf-8"))
+        self.digest.update(b"\0")
+
+    def build(self):
+        return BM25Index(dict(self.postings), self.doc_lengths, self.digest.hexdigest())
+
+
+class BM25Index:
+    def __init__(self, postings, doc_lengths, fingerprint=None):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.fingerprint = fingerprint
+        count = len(doc_lengths)
+        avg_length = sum(doc_lengths) / count if count else 0.0
+        # Per-document length normalisation, precomputed once
+        self.doc_norms = [K1 * (1 - B + B * length / avg_length) if avg_length else K1 for length in doc_lengths]
+        self.idf = {
+            term: math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in postings.items()
+        }
+
+    @classmethod
+    def build(cls, texts):
+        builder = BM25Builder()
+        for text in texts:
+            builder.add(text)
+        return builder.build()
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "doc_lengths": self.doc_lengths, "postings": self.postings}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["postings"], data["doc_lengths"], data.get("fingerprint"))
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def search(self, query, top_n=5):
+        """[(doc, score), ...] of the best `top_n` documents sharing a term with `query`, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf[term]
+            for doc, tf in posting:
+                scores[doc] += idf * tf * (K1 + 1) / (tf + self.doc_norms[doc])
+        return heapq.nlargest(top_n, scores.items(), key=lambda item: item[1])
+
+
+def load_or_build(index_path, texts):
+    """The saved index at `index_path` if it matches `texts`, otherwise a fresh one (saved for next time)."""
+    expected = fingerprint(texts)
+    if os.path.exists(index_path):
+        try:
+            index = BM25Index.load(index_path)
+            if index.fingerprint == expected:
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable BM25 index {index_path}: {e}", file=sys.stderr)
+
+    index = BM25Index.build(texts)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        print(f"Could not save BM25 index to {index_path}: {e}", file=sys.stderr)
+    return index
@@ -0,0 +1,161 @@
+import os
+import sys
+import ast
+import json
+import argparse
+import textwrap
+
+# === Function-level code index over the scraped GitHub corpus ===
+# Whole files are too large to inject into a prompt, so each file is split
+# with `ast` into its top-level functions and classes (approval_program,
+# clear_state_program, ...). Definitions longer than MAX_CHUNK_LINES are
+# split into their nested definitions, with each run of the definition's own
+# lines around them (header, class attributes, code between nested defs)
+# windowed under its name; definitions without nested ones are windowed by
+# lines. Each run of module-level lines (imports, the compileTeal main
+# block) forms its own chunk. Files that do not parse are windowed by lines.
+# Chunks keep their source path and line span and are embedded into an
+# ordinary store (embedding_store.py), which the Gemini script searches for
+# snippets.
+#
+#     python code_index.py build
+#     python code_index.py search "stateful counter approval program"
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_FILES = [
+    os.path.join(SCRIPT_DIR, "data", "algorand_github_clean.jsonl"),
+    os.path.join(SCRIPT_DIR, "data", "github_code_data.jsonl"),
+]
+CHUNKS_FILE = os.path.join(SCRIPT_DIR, "data", "code_chunks.jsonl")
+CODE_STORE_DIR = os.path.join(SCRIPT_DIR, "data", "code_store")
+MAX_CHUNK_LINES = 120
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def node_span(node):
+    """1-based (first, last) line of a definition, decorators included."""
+    first = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+    return first, node.end_lineno
+
+
+def window_chunks(numbered, name, kind):
+    """Consecutive windows of at most MAX_CHUNK_LINES over (line number, text) pairs."""
+    for start in range(0, len(numbered), MAX_CHUNK_LINES):
+        window = numbered[start:start + MAX_CHUNK_LINES]
+        code = textwrap.dedent("\n".join(text for _, text in window)).strip("\n")
+        if code.strip():
+            yield {"name": name, "kind": kind, "start_line": window[0][0], "end_line": window[-1][0], "code": code}
+
+
+def numbered_lines(lines, first, last):
+    return [(number, lines[number - 1]) for number in range(first, last + 1)]
+
+
+def definition_chunks(node, lines, prefix=""):
+    name = prefix + node.name
+    kind = "class" if isinstance(node, ast.ClassDef) else "function"
+    first, last = node_span(node)
+    children = [child for child in node.body if isinstance(child, DEFINITIONS)]
+    if last - first < MAX_CHUNK_LINES or not children:
+        yield from window_chunks(numbered_lines(lines, first, last), name, kind)
+        return
+    # The parent keeps the lines its nested definitions don't cover
+    start = first
+    for child in children:
+        child_first, child_last = node_span(child)
+        yield from window_chunks(numbered_lines(lines, start, child_first - 1), name, kind)
+        yield from definition_chunks(child, lines, name + ".")
+        start = child_last + 1
+    yield from window_chunks(numbered_lines(lines, start, last), name, kind)
+
+
+def chunk_source(source):
+    """Chunks (dicts with name, kind, start_line, end_line, code) of one Python file."""
+    lines = source.splitlines()
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        yield from window_chunks(numbered_lines(lines, 1, len(lines)), "<file>", "lines")
+        return
+
+    # The module-level lines between two definitions (statements and comments)
+    # form one chunk, so a chunk's line span never covers a definition
+    start = 1
+    for node in tree.body:
+        if isinstance(node, DEFINITIONS):
+            first, last = node_span(node)
+            yield from window_chunks(numbered_lines(lines, start, first - 1), "<module>", "module")
+            yield from definition_chunks(node, lines)
+            start = last + 1
+    yield from window_chunks(numbered_lines(lines, start, len(lines)), "<module>", "module")
+
+
+def is_source(code):
+    # Some github_code_data.jsonl records carry the file URL instead of its source
+    return bool(code.strip()) and not (code.startswith(("http://", "https://")) and "\n" not in code)
+
+
+def iter_code_chunks(paths=CODE_FILES):
+    """Yields chunk records, with their source path, for every file of the .jsonl corpora in `paths`."""
+    for filepath in paths:
+        if not os.path.exists(filepath):
+            print(f"Warning: Code file not found at {filepath}.", file=sys.stderr)
+            continue
+        with open(filepath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Error decoding JSON from line: {line.strip()[:80]} - {e}", file=sys.stderr)
+                    continue
+                code = record.get("code", "")
+                if not is_source(code):
+                    continue
+                for chunk in chunk_source(code):
+                    yield dict(chunk, file_path=record.get("file_path", ""))
+
+
+def write_chunks(paths=CODE_FILES, output=CHUNKS_FILE):
+    count = 0
+    with open(output, "w", encoding="utf-8") as f:
+        for chunk in iter_code_chunks(paths):
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"Wrote {count} code chunks to {output}", file=sys.stderr)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Function-level code chunk index over the GitHub corpus.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Chunk the corpus and embed the chunks into a store")
+    build.add_argument("--input", action="append", help="Code .jsonl file with file_path/code records, repeatable")
+    build.add_argument("--chunks", default=CHUNKS_FILE, help="Chunk .jsonl to write")
+    build.add_argument("--output", default=CODE_STORE_DIR, help="Store directory to write")
+    build.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                       help="Encoder processes, used only for large chunks of new rows (see create_embeddings.py)")
+    build.add_argument("--no-embed", action="store_true", help="Only write the chunk file")
+    search = sub.add_parser("search", help="Print the chunks closest to a query")
+    search.add_argument("query")
+    search.add_argument("--store", default=CODE_STORE_DIR)
+    search.add_argument("--top-n", type=int, default=5)
+    search.add_argument("--threshold", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if not write_chunks(args.input or CODE_FILES, args.chunks) or args.no_embed:
+            return
+        from create_embeddings import create_and_store_embeddings
+        create_and_store_embeddings([args.chunks], args.output, workers=args.workers)
+    elif args.command == "search":
+        from retrieval import get_samples, find_matching_samples
+        if not os.path.isdir(args.store):
+            print(f"No code store at {args.store}; run `python code_index.py build` first.", file=sys.stderr)
+            sys.exit(1)
+        for chunk in find_matching_samples(args.query, get_samples(args.store), top_n=args.top_n, threshold=args.threshold):
+            print(json.dumps(chunk, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,159 @@
 import json
 import os
 import sys
+import time
+import argparse
+import numpy as np
 from sentence_transformers import SentenceTransformer
-import numpy as np # For converting embeddings to list for JSON serialization
+from embedding_store import EmbeddingStore, StoreWriter, embedding_text, content_hash
 
 # Configuration
 SAMPLES_FILE = os.path.join("data", "samples.jsonl")
-VECTOR_SAMPLES_FILE = os.path.join("data", "vector_samples.jsonl")
+VECTOR_STORE_DIR = os.path.join("data", "vector_store")  # Binary store read by retrieval.py
 EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2' # Use the same model as your main script
 
-def load_raw_samples(filepath):
-    """Loads instructions and outputs from a .jsonl file."""
-    samples = []
-    if not os.path.exists(filepath):
-        print(f"Error: Samples file not found at {filepath}. Cannot create embeddings.", file=sys.stderr)
-        return []
-    with open(filepath, 'r', encoding='utf-8') as f:
-        for line in f:
-            try:
-                samples.append(json.loads(line))
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from line: {line.strip()} - {e}", file=sys.stderr)
-    return samples
-
-def create_and_store_embeddings():
-    print(f"Loading SentenceTransformer model: {EMBEDDING_MODEL_NAME}...")
+# Inputs are streamed in chunks of CHUNK_SIZE samples; each chunk is encoded
+# (across the worker pool) and appended to the store before the next is read,
+# so memory stays bounded by the chunk rather than the corpus. e.g.
+#
+#     python create_embeddings.py --input data/algorand_github_clean.jsonl --input data/ipop.jsonl \
+#         --output data/code_store --workers 8
+CHUNK_SIZE = 1024
+BATCH_SIZE = 32
+# Fewer rows than this per chunk are encoded in-process: starting the worker
+# pool costs more than it saves for an incremental run touching a few samples
+POOL_MIN_ROWS = 256
+
+def iter_chunks(paths, chunk_size=CHUNK_SIZE):
+    """Yields lists of up to `chunk_size` samples read from the .jsonl files in `paths`."""
+    chunk = []
+    for filepath in paths:
+        if not os.path.exists(filepath):
+            print(f"Error: Samples file not found at {filepath}. Cannot create embeddings.", file=sys.stderr)
+            continue
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    chunk.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    print(f"Error decoding JSON from line: {line.strip()} - {e}", file=sys.stderr)
+                    continue
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+def load_previous_rows(store_dir, dtype):
+    """Maps content hash -> row of the existing store, if it was built by the same model and dtype."""
+    if not os.path.isdir(store_dir):
+        return None, {}
+    try:
+        store = EmbeddingStore.open(store_dir)
+    except (OSError, ValueError) as e:
+        print(f"Existing store unreadable ({e}); rebuilding from scratch.", file=sys.stderr)
+        return None, {}
+    if store.hashes is None or store.meta.get("model") != EMBEDDING_MODEL_NAME or store.meta.get("dtype") != dtype:
+        return None, {}
+    return store, {bytes(h): row for row, h in enumerate(store.hashes)}
+
+class Encoder:
+    """Loads the model on first use; with several workers, large batches go through a multi-process CPU pool."""
+
+    def __init__(self, workers, batch_size=BATCH_SIZE):
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.model = None
+        self.pool = None
+
+    def encode(self, texts):
+        if self.model is None:
+            print(f"Loading SentenceTransformer model: {EMBEDDING_MODEL_NAME}...")
+            self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+            print("Model loaded.")
+        if self.pool is None and self.workers > 1 and len(texts) >= POOL_MIN_ROWS:
+            # One intra-op thread per worker process, or the workers fight over the cores
+            os.environ.setdefault("OMP_NUM_THREADS", "1")
+            self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+        if self.pool is not None and len(texts) >= POOL_MIN_ROWS:
+            return self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_tensor=False)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+def create_and_store_embeddings(inputs=(SAMPLES_FILE,), output=VECTOR_STORE_DIR, dtype="float32", index="auto",
+                                nlist=None, full=False, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, workers=1):
+    # Incremental: reuse the rows of unchanged texts from the current store
+    previous, previous_rows = (None, {}) if full else load_previous_rows(output, dtype)
+    encoder = Encoder(workers, batch_size)
+    writer = None
+    rows = encoded_rows = 0
+    reused_hashes = set()
+    start = time.perf_counter()
+
     try:
-        model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-        print("Model loaded.")
+        for chunk in iter_chunks(inputs, chunk_size):
+            texts = [embedding_text(sample) for sample in chunk]
+            hashes = [content_hash(text) for text in texts]
+            missing = [i for i, h in enumerate(hashes) if h not in previous_rows]
+
+            encoded = np.asarray(encoder.encode([texts[i] for i in missing])) if missing else None
+            dim = encoded.shape[1] if encoded is not None else previous.embeddings.shape[1]
+            embeddings = np.zeros((len(chunk), dim), dtype=np.float32)
+            if encoded is not None:
+                embeddings[missing] = encoded
+            reused = [i for i, h in enumerate(hashes) if h in previous_rows]
+            if reused:
+                embeddings[reused] = previous.embeddings[[previous_rows[hashes[i]] for i in reused]]
+                reused_hashes.update(hashes[i] for i in reused)
+
+            if writer is None:
+                writer = StoreWriter(output, dtype=dtype, meta={"model": EMBEDDING_MODEL_NAME}, index=index, nlist=nlist)
+            writer.add(chunk, embeddings, hashes)
+
+            rows += len(chunk)
+            encoded_rows += len(missing)
+            elapsed = time.perf_counter() - start
+            print(f"{rows} rows ({encoded_rows} encoded, {rows - encoded_rows} reused) "
+                  f"in {elapsed:.1f}s, {rows / max(elapsed, 1e-9):.0f} rows/s", file=sys.stderr)
     except Exception as e:
-        print(f"Error loading SentenceTransformer model: {e}", file=sys.stderr)
-        print("Please ensure you have internet access for the first download or model is cached.")
-        return
+        print(f"Error creating embeddings: {e}", file=sys.stderr)
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        encoder.close()
 
-    raw_samples = load_raw_samples(SAMPLES_FILE)
-    if not raw_samples:
+    if writer is None:
         print("No raw samples to process. Exiting.")
         return
 
-    instructions = [s.get("instruction", "") for s in raw_samples]
-    print(f"Encoding {len(instructions)} instructions...")
-    # Encode in batches for efficiency
-    instruction_embeddings = model.encode(instructions, convert_to_tensor=False) # Convert to numpy array directly
-
-    print(f"Storing embeddings to {VECTOR_SAMPLES_FILE}...")
-    with open(VECTOR_SAMPLES_FILE, 'w', encoding='utf-8') as f_out:
-        for i, sample in enumerate(raw_samples):
-            # Convert numpy array embedding to a list for JSON serialization
-            sample['embedding'] = instruction_embeddings[i].tolist()
-            f_out.write(json.dumps(sample) + '\n')
+    print(f"{len(previous_rows) - len(reused_hashes)} rows dropped from the previous store.")
+    print(f"Storing embeddings to {output} ({dtype})...")
+    del previous  # release the old store's memory maps before it is swapped out
+    writer.close()
     print("Embeddings stored successfully.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed .jsonl samples into a retrieval store.")
+    parser.add_argument("--input", action="append", help=f"Input .jsonl file, repeatable (default {SAMPLES_FILE})")
+    parser.add_argument("--output", default=VECTOR_STORE_DIR, help="Store directory to write")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="float16 halves the store size at a small precision cost")
+    parser.add_argument("--index", choices=["auto", "flat", "ivf"], default="auto",
+                        help="Nearest-neighbour index to build (auto: IVF for large corpora)")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cluster count (default sqrt(rows))")
+    parser.add_argument("--full", action="store_true", help="Re-encode everything instead of only new/changed samples")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Samples read and written per step")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Encoder batch size")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help=f"Encoder processes for chunks of {POOL_MIN_ROWS}+ new rows (default: CPU cores; 1 encodes in-process)")
+    args = parser.parse_args()
+
     # Ensure the 'data' directory exists
     os.makedirs("data", exist_ok=True)
-    create_and_store_embeddings()
+    create_and_store_embeddings(args.input or [SAMPLES_FILE], args.output, args.dtype, args.index, args.nlist,
+                                args.full, args.chunk_size, args.batch_size, args.workers)
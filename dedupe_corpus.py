@@ -0,0 +1,240 @@
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+import numpy as np
+from code_index import is_source
+
+# === Near-duplicate removal with MinHash/LSH ===
+# github_database.py runs overlapping search queries, so the scraped corpora
+# hold many copies of the same file. Each record is reduced to MinHash
+# signatures over its token shingles; LSH banding puts likely near-duplicates
+# in a shared bucket, and only those candidates are compared, so the pass is
+# one streaming scan in near-linear time. Scraped files and instruction/output
+# pairs are kept in separate indexes: a file is a duplicate when its code
+# reaches THRESHOLD estimated Jaccard similarity to an earlier kept file, a
+# pair only when both its instruction and its output do (many pairs share a
+# boilerplate output but ask for different things). The first copy wins, in
+# input order. Each input is rewritten, in its own format, under OUTPUT_DIR.
+#
+#     python dedupe_corpus.py
+#     python dedupe_corpus.py --input data/ipop.jsonl --threshold 0.9 --report dups.jsonl
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_FILES = [
+    os.path.join(SCRIPT_DIR, "data", "algorand_github_dataset.txt"),
+    os.path.join(SCRIPT_DIR, "data", "github_code_data.jsonl"),
+    os.path.join(SCRIPT_DIR, "data", "ipop.jsonl"),
+    os.path.join(SCRIPT_DIR, "data", "samples.jsonl"),
+]
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "data", "dedup")
+
+THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+# 16 bands of 8 rows: a pair shares a bucket with probability 1 - (1 - s**8)**16,
+# about 0.62 at Jaccard 0.7, 0.95 at 0.8 (the default THRESHOLD) and 0.9999 at 0.9
+BANDS = 16
+# Records that are not exact copies of an earlier one are rarely near-duplicates
+# either; a file that keeps fewer than this share of them is reported, as the
+# threshold is then likely too loose
+MIN_DISTINCT_KEPT = 0.9
+FILE_HEADER = "# File: "
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+# === Corpus readers and writers ===
+
+def read_dataset_txt(filepath):
+    """Records of a github_database.py dump: files introduced by '# File: <url>' lines."""
+    record = None
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(FILE_HEADER):
+                if record is not None:
+                    yield record
+                record = {"file_path": line[len(FILE_HEADER):].strip(), "lines": []}
+            elif record is not None:
+                record["lines"].append(line)
+    if record is not None:
+        yield record
+
+
+def read_jsonl(filepath):
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON from line: {line.strip()[:80]} - {e}", file=sys.stderr)
+
+
+def read_records(filepath):
+    if filepath.endswith(".txt"):
+        for record in read_dataset_txt(filepath):
+            yield {"file_path": record["file_path"], "code": "".join(record["lines"]).strip("\n")}
+    else:
+        yield from read_jsonl(filepath)
+
+
+def write_record(f, filepath, record):
+    if filepath.endswith(".txt"):
+        # Same layout github_database.py appends
+        f.write(f"\n{FILE_HEADER}{record['file_path']}\n{record['code']}\n")
+    else:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def record_kind(record):
+    return "code" if "code" in record else "pair"
+
+
+def record_texts(record):
+    """Texts compared for duplicates: the code of scraped files, the output and instruction of pairs."""
+    if "code" in record:
+        return [record["code"]]
+    return [record.get("output", ""), record.get("instruction", "")]
+
+
+def record_label(record):
+    return record.get("file_path") or record.get("instruction", "")[:80]
+
+
+# === MinHash / LSH ===
+
+def shingles(text):
+    """32-bit hashes of the token SHINGLE_SIZE-grams of `text` (whitespace and case ignored)."""
+    tokens = TOKEN_RE.findall(text.lower())
+    if len(tokens) <= SHINGLE_SIZE:
+        grams = [" ".join(tokens)]
+    else:
+        grams = [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+    return np.unique(np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64))
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        # a, b < 2**32 keep a * x + b inside uint64 for 32-bit x
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        """(num_perm,) minimum of each universal hash over the shingle hashes."""
+        permuted = ((hashes[:, None] * self.a + self.b) % MERSENNE_PRIME) & MAX_HASH
+        return permuted.min(axis=0)
+
+
+class LSHIndex:
+    """
+    Signatures of kept records, bucketed by band; duplicates are checked
+    against bucket mates only. A record's signature is a (fields, num_perm)
+    array: buckets use its first field, and a candidate counts as a duplicate
+    only when every field reaches the threshold.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, threshold=THRESHOLD):
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.threshold = threshold
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = []
+        self.labels = []
+
+    def band_keys(self, signature):
+        return [signature[0, i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature, keys):
+        """(kept id, estimated Jaccard) of the most similar candidate at or above threshold, else None."""
+        candidates = set()
+        for bucket, key in zip(self.buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        best = None
+        for candidate in candidates:
+            similarity = float(np.mean(self.signatures[candidate] == signature, axis=1).min())
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def add(self, signature, keys, label):
+        kept = len(self.signatures)
+        self.signatures.append(signature)
+        self.labels.append(label)
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, []).append(kept)
+        return kept
+
+
+def dedupe(inputs=CORPUS_FILES, output_dir=OUTPUT_DIR, threshold=THRESHOLD, report=None):
+    """Writes each input without near-duplicates (of itself or earlier inputs) to `output_dir`."""
+    os.makedirs(output_dir, exist_ok=True)
+    hasher = MinHasher()
+    indexes = {"code": LSHIndex(threshold=threshold), "pair": LSHIndex(threshold=threshold)}
+    exact = set()
+    stats = []
+    report_file = open(report, "w", encoding="utf-8") if report else None
+
+    try:
+        for filepath in inputs:
+            if not os.path.exists(filepath):
+                print(f"Warning: Corpus file not found at {filepath}.", file=sys.stderr)
+                continue
+            output = os.path.join(output_dir, os.path.basename(filepath))
+            if os.path.abspath(output) == os.path.abspath(filepath):
+                raise ValueError(f"Output {output} would overwrite its input; pick another --output-dir")
+            read = kept = distinct = 0
+            with open(output, "w", encoding="utf-8") as out:
+                for record in read_records(filepath):
+                    read += 1
+                    texts = record_texts(record)
+                    fingerprint = hash((record_kind(record), *texts))
+                    if fingerprint not in exact:
+                        exact.add(fingerprint)
+                        distinct += 1
+                    if "code" in record and not is_source(record["code"]):
+                        # URL-only placeholders carry no source to compare; pass them through
+                        write_record(out, filepath, record)
+                        kept += 1
+                        continue
+                    index = indexes[record_kind(record)]
+                    signature = np.stack([hasher.signature(shingles(text)) for text in texts])
+                    keys = index.band_keys(signature)
+                    match = index.query(signature, keys)
+                    if match is not None:
+                        if report_file is not None:
+                            report_file.write(json.dumps({
+                                "file": os.path.basename(filepath),
+                                "record": record_label(record),
+                                "duplicate_of": index.labels[match[0]],
+                                "similarity": round(match[1], 3),
+                            }, ensure_ascii=False) + "\n")
+                        continue
+                    index.add(signature, keys, record_label(record))
+                    write_record(out, filepath, record)
+                    kept += 1
+            stats.append({"file": os.path.basename(filepath), "records": read, "distinct": distinct,
+                          "kept": kept, "dropped": read - kept})
+            print(f"{filepath}: kept {kept} of {read} records ({distinct} distinct) -> {output}", file=sys.stderr)
+            if kept < MIN_DISTINCT_KEPT * distinct:
+                print(f"Warning: {filepath} kept only {kept} of {distinct} distinct records; "
+                      f"check --threshold or the --report", file=sys.stderr)
+    finally:
+        if report_file is not None:
+            report_file.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove near-duplicate records from the scraped corpora.")
+    parser.add_argument("--input", action="append", help="Corpus file (.jsonl or a github_database.py .txt dump), repeatable")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Directory the deduplicated files are written to")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Estimated Jaccard similarity that counts as a duplicate")
+    parser.add_argument("--report", help="Optional .jsonl listing each dropped record and what it duplicates")
+    args = parser.parse_args()
+
+    print(json.dumps(dedupe(args.input or CORPUS_FILES, args.output_dir, args.threshold, args.report), indent=2))
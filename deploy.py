@@ -4,7 +4,6 @@ from dotenv import load_dotenv
 from algosdk import account, transaction
 from algosdk.v2client import algod
 from algosdk.transaction import StateSchema
-from pyteal import compileTeal, Mode
 from algosdk.logic import get_application_address
 from algosdk import logic
 from algosdk.logic import address as logic_address
@@ -95,6 +94,9 @@ def deploy_stateless(teal_source):
 def deploy_contract(code, contract_type, lang):
     try:
         if lang.lower() == "pyteal":
+            # Imported here so TEAL deploys and startup don't pay for PyTeal
+            from pyteal import compileTeal, Mode
+
             namespace = {}
             exec(code, namespace)
 
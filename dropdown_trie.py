@@ -0,0 +1,236 @@
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+from collections import Counter
+
+# === Corpus-backed prefix index for dropdown suggestions ===
+# Identifier and whole-line frequencies from the Algorand corpora, plus known
+# PyTeal names, are stored in a character trie whose nodes keep their best
+# candidates precomputed, so a lookup is one walk down the typed prefix.
+# inferenceDropDown.py answers from here and only runs the model when the
+# index has nothing confident: a candidate is offered only when it makes up at
+# least ALGOMATE_DROPDOWN_MIN_SHARE of the corpus occurrences of all terms
+# sharing the typed prefix, so prefixes spread over many rare terms go to the
+# model. Rebuild the index after the corpora change:
+#
+#     python dropdown_trie.py build
+#     python dropdown_trie.py query "App.glo"
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_FILE = os.path.join(SCRIPT_DIR, "data", "dropdown_index.json")
+SOURCES = [
+    (os.path.join(SCRIPT_DIR, "data", "algorand_github_clean.jsonl"), "code"),
+    (os.path.join(SCRIPT_DIR, "data", "samples.jsonl"), "output"),
+]
+
+MAX_CANDIDATES = 8
+MIN_COUNT = 2           # occurrences needed before a corpus term is indexed
+PYTEAL_WEIGHT = 5       # bonus so API names outrank one-off identifiers
+MAX_LINE_LENGTH = 80
+# Share of the prefix's total count a candidate needs to be offered
+MIN_SHARE = float(os.getenv("ALGOMATE_DROPDOWN_MIN_SHARE", "0.05"))
+
+PYTEAL_NAMES = [
+    "App.globalPut", "App.globalGet", "App.globalDel", "App.globalGetEx",
+    "App.localPut", "App.localGet", "App.localDel", "App.localGetEx",
+    "App.optedIn", "App.id()",
+    "Txn.sender()", "Txn.application_id()", "Txn.application_args",
+    "Txn.application_args.length()", "Txn.on_completion()", "Txn.type_enum()",
+    "Txn.amount()", "Txn.receiver()", "Txn.fee()", "Txn.rekey_to()",
+    "Txn.close_remainder_to()", "Txn.asset_close_to()", "Txn.xfer_asset()",
+    "Txn.asset_amount()", "Txn.asset_receiver()", "Txn.accounts", "Txn.assets",
+    "Txn.applications", "Txn.group_index()", "Txn.note()",
+    "Gtxn", "Global.group_size()", "Global.latest_timestamp()", "Global.round()",
+    "Global.creator_address()", "Global.current_application_id()",
+    "Global.current_application_address()", "Global.min_txn_fee()",
+    "Global.zero_address()", "Global.min_balance()",
+    "InnerTxnBuilder.Begin()", "InnerTxnBuilder.SetFields", "InnerTxnBuilder.Submit()",
+    "InnerTxnBuilder.Execute", "InnerTxn.created_asset_id()",
+    "OnComplete.NoOp", "OnComplete.OptIn", "OnComplete.CloseOut",
+    "OnComplete.UpdateApplication", "OnComplete.DeleteApplication", "OnComplete.ClearState",
+    "TxnType.Payment", "TxnType.AssetTransfer", "TxnType.ApplicationCall",
+    "TxnField.type_enum", "TxnField.receiver", "TxnField.amount", "TxnField.xfer_asset",
+    "TxnField.asset_receiver", "TxnField.asset_amount", "TxnField.fee",
+    "Mode.Application", "Mode.Signature", "compileTeal", "Approve()", "Reject()",
+    "Return", "Seq", "Cond", "If", "Assert", "Int", "Bytes", "Btoi", "Itob",
+    "Concat", "Len", "Sha256", "Keccak256", "Ed25519Verify", "ScratchVar", "Subroutine",
+    "TealType.uint64", "TealType.bytes", "TealType.none", "Router", "BareCallActions",
+    "OnCompleteAction.create_only", "OnCompleteAction.call_only", "OnCompleteAction.always",
+    "CallConfig.CREATE", "CallConfig.CALL", "abi.Uint64", "abi.String", "abi.Address",
+    "abi.Account", "abi.Asset", "abi.PaymentTransaction", "AssetHolding.balance",
+    "AssetParam.total", "Balance", "MinBalance",
+]
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*(?:\(\))?")
+FRAGMENT_RE = re.compile(r"[A-Za-z_][\w.]*$")
+
+
+class _Node:
+    __slots__ = ("children", "top", "total")
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+        # Summed score of every term below this node, not just the top ones
+        self.total = 0
+
+
+class PrefixTrie:
+    """Character trie over scored terms; every node holds its best `max_candidates` completions."""
+
+    def __init__(self, scored_terms, max_candidates=MAX_CANDIDATES):
+        self.root = _Node()
+        self.size = 0
+        # Inserting best-first means each node's list fills with its top terms
+        for term, score in sorted(scored_terms, key=lambda item: (-item[1], item[0])):
+            node = self.root
+            for char in term:
+                node = node.children.setdefault(char, _Node())
+                node.total += score
+                if len(node.top) < max_candidates:
+                    node.top.append((term, score))
+            self.size += 1
+
+    def lookup(self, prefix):
+        """
+        ([(term, score), ...] for the best terms starting with `prefix`, best
+        first; summed score of all terms starting with `prefix`).
+        """
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return [], 0
+        return node.top, node.total
+
+
+# === Building ===
+
+def iter_corpus_texts(sources=SOURCES):
+    for path, field in sources:
+        if not os.path.exists(path):
+            print(f"Warning: corpus not found at {path}, skipping", file=sys.stderr)
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    text = json.loads(line).get(field, "")
+                except json.JSONDecodeError:
+                    continue
+                if text:
+                    yield text
+
+
+def pyteal_names():
+    """The static PyTeal list, extended with the installed package's public names if available."""
+    names = set(PYTEAL_NAMES)
+    try:
+        import pyteal
+        names.update(name for name in dir(pyteal) if name[:1].isupper())
+    except ImportError:
+        pass
+    return names
+
+
+def build_index(sources=SOURCES, min_count=MIN_COUNT):
+    """Counts identifiers and stripped source lines; returns the serialisable index."""
+    identifiers, lines = Counter(), Counter()
+    for text in iter_corpus_texts(sources):
+        identifiers.update(match for match in IDENTIFIER_RE.findall(text) if len(match) >= 3)
+        for line in text.splitlines():
+            line = line.strip()
+            if 4 <= len(line) <= MAX_LINE_LENGTH and not line.startswith("#"):
+                lines[line] += 1
+
+    for name in pyteal_names():
+        identifiers[name] += PYTEAL_WEIGHT
+
+    return {
+        "identifiers": sorted([term, count] for term, count in identifiers.items() if count >= min_count),
+        "lines": sorted([term, count] for term, count in lines.items() if count >= min_count),
+    }
+
+
+def save_index(index, path=INDEX_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+
+
+# === Lookup ===
+
+class DropdownIndex:
+    """Identifier and line tries answering dropdown prompts (the text before the cursor)."""
+
+    def __init__(self, index, min_share=MIN_SHARE):
+        self.identifiers = PrefixTrie(index["identifiers"])
+        self.lines = PrefixTrie(index["lines"])
+        self.min_share = min_share
+
+    def suggest(self, text, limit=MAX_CANDIDATES):
+        """
+        Completions for the cursor position, relative to the word being typed
+        (the editor replaces that word with the chosen item). Candidates below
+        `min_share` of the prefix's total count are left out; an empty list
+        means the index is not confident and the model should answer.
+        """
+        current_line = text[text.rfind("\n") + 1:]
+        match = FRAGMENT_RE.search(current_line)
+        if match:
+            fragment = match.group(0)
+            candidates, total = self.identifiers.lookup(fragment)
+            # The editor's word starts after the last dot
+            word_start = fragment.rfind(".") + 1
+        else:
+            fragment = current_line.lstrip()
+            if len(fragment) < 2:
+                return []
+            candidates, total = self.lines.lookup(fragment)
+            word_start = len(fragment)
+
+        return [
+            term[word_start:] for term, score in candidates
+            if score >= self.min_share * total and term != fragment and term[word_start:].strip()
+        ][:limit]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(path=INDEX_FILE):
+    """The process-wide DropdownIndex, loaded from `path` or built from the corpora if missing."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            else:
+                print(f"Dropdown index not found at {path}; building it in memory", file=sys.stderr)
+                index = build_index()
+            _index = DropdownIndex(index)
+        return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the dropdown prefix index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Index the corpora into data/dropdown_index.json")
+    build.add_argument("--min-count", type=int, default=MIN_COUNT)
+    query = sub.add_parser("query", help="Show the suggestions for a prompt")
+    query.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index(min_count=args.min_count)
+        save_index(index)
+        print(f"Indexed {len(index['identifiers'])} identifiers and {len(index['lines'])} lines into {INDEX_FILE}")
+    elif args.command == "query":
+        print(json.dumps(get_index().suggest(args.text)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# === Query-embedding cache ===
+# Repeated instructions (webview retries, the same ghost prefix typed again)
+# skip the SentenceTransformer forward pass: vectors are looked up by a hash
+# of model name and text, first in an in-process LRU and then in an SQLite
+# file shared by all backend processes. ALGOMATE_EMBEDDING_CACHE_SIZE sets the
+# LRU size; ALGOMATE_EMBEDDING_CACHE_FILE="" disables the disk layer.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_SIZE = int(os.getenv("ALGOMATE_EMBEDDING_CACHE_SIZE", "1024"))
+DEFAULT_CACHE_FILE = os.getenv("ALGOMATE_EMBEDDING_CACHE_FILE", os.path.join(SCRIPT_DIR, "data", "embedding_cache.sqlite"))
+STATS_LOG_INTERVAL = 100
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, path=DEFAULT_CACHE_FILE):
+        self.max_entries = max_entries
+        self.path = path
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._next_log = STATS_LOG_INTERVAL
+        self._memory = OrderedDict()
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None and self.path:
+            try:
+                self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+                self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            except sqlite3.Error as e:
+                print(f"Embedding cache disabled: {e}", file=sys.stderr)
+                self.path = None
+        return self._db
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def encode(self, model_name, texts, encode_fn):
+        """
+        Embeddings for `texts`, one row each. Only cache misses are passed to
+        `encode_fn(texts)`, so the model need not even be loaded on a full hit.
+        """
+        keys = [cache_key(model_name, text) for text in texts]
+        vectors = [None] * len(texts)
+
+        with self._lock:
+            db = self._connect()
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[i] = self._memory[key]
+                    self.memory_hits += 1
+                elif db is not None:
+                    row = db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        vectors[i] = np.frombuffer(row[0], dtype=np.float32)
+                        self._remember(key, vectors[i])
+                        self.disk_hits += 1
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            with self._lock:
+                db = self._connect()
+                for i, vector in zip(missing, encoded):
+                    vectors[i] = vector
+                    self._remember(keys[i], vector)
+                if db is not None:
+                    try:
+                        db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                                       [(keys[i], vectors[i].tobytes()) for i in missing])
+                        db.commit()
+                    except sqlite3.Error as e:
+                        # Another process holding the lock only costs us the disk copy
+                        print(f"Embedding cache write failed: {e}", file=sys.stderr)
+                self.misses += len(missing)
+
+        if self.memory_hits + self.disk_hits + self.misses >= self._next_log:
+            self._next_log += STATS_LOG_INTERVAL
+            print(f"Query embedding cache: {self.stats()}", file=sys.stderr)
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+            "entries": len(self._memory),
+        }
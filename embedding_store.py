@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import mmap
+import shutil
+import hashlib
+import numpy as np
+from ann_index import FlatIndex, top_k, top_k_rows, build_index, load_index
+from bm25_index import BM25Builder, BM25Index
+
+# === Binary embedding store ===
+# A store is a directory holding
+#   embeddings.npy  (N, dim) float32/float16 matrix of L2-normalised rows
+#   offsets.npy     (N + 1,) int64 byte offsets into samples.bin
+#   samples.bin     the samples' JSON (without embeddings), back to back
+#   hashes.npy      (N,) content hash of the text each row embeds, used by
+#                   incremental rebuilds (optional)
+#   lexical.json    BM25 postings over the embedded texts, the first stage of
+#                   cascade retrieval (bm25_index.py)
+#   meta.json       model name, dtype, row count, index kind
+# plus the files of its nearest-neighbour index (ann_index.py), if any.
+# Readers memory-map the arrays, so opening a store is O(1) and only the
+# rows that are actually returned are ever decoded into Python objects.
+
+EMBEDDINGS_FILE = "embeddings.npy"
+OFFSETS_FILE = "offsets.npy"
+RECORDS_FILE = "samples.bin"
+HASHES_FILE = "hashes.npy"
+LEXICAL_FILE = "lexical.json"
+META_FILE = "meta.json"
+RERANK_CHUNK = 64   # queries per rerank_batch product, bounds the (queries, candidates) score matrix
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def embedding_text(sample):
+    """Instruction for instruction/output samples, the source itself for scraped code records."""
+    return sample.get("instruction") or sample.get("code", "")
+
+
+def content_hash(text):
+    """sha256 of the embedded text; rows with an unchanged hash are reused, not re-encoded."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """Read side of a store: a normalised embedding matrix plus lazily decoded samples."""
+
+    def __init__(self, embeddings, offsets, records, meta=None, index=None, hashes=None, path=None):
+        self.embeddings = embeddings
+        self.offsets = offsets
+        self.records = records
+        self.meta = meta or {}
+        self.index = index or FlatIndex(embeddings)
+        self.hashes = hashes
+        self.path = path
+        self._lexical = None
+        self._rows_by_hash = None
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # Zero-length arrays cannot be memory-mapped
+        mmap_mode = "r" if meta.get("count") else None
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode=mmap_mode)
+        with open(os.path.join(path, RECORDS_FILE), "rb") as f:
+            # mmap refuses empty files
+            records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        hashes_path = os.path.join(path, HASHES_FILE)
+        hashes = np.load(hashes_path, mmap_mode=mmap_mode) if os.path.exists(hashes_path) else None
+        return cls(embeddings, offsets, records, meta, load_index(path, embeddings, meta), hashes, path)
+
+    @classmethod
+    def from_samples(cls, samples, key="embedding"):
+        """In-memory store from dicts carrying their embedding (the legacy vector_samples.jsonl)."""
+        embeddings = normalize_rows([sample[key] for sample in samples]) if samples else np.zeros((0, 0), np.float32)
+        records, offsets = encode_records({k: v for k, v in sample.items() if k != key} for sample in samples)
+        return cls(embeddings, offsets, records)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def sample(self, index):
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return json.loads(bytes(self.records[start:end]).decode("utf-8"))
+
+    def rows_for(self, samples):
+        """Row of each sample dict, matched by content hash; None where the store has no row for its text."""
+        if self._rows_by_hash is None:
+            hashes = self.hashes if self.hashes is not None else ()
+            self._rows_by_hash = {bytes(h): row for row, h in enumerate(hashes)}
+        return [self._rows_by_hash.get(content_hash(embedding_text(sample))) for sample in samples]
+
+    def search(self, query, top_n=5, threshold=None, nprobe=None):
+        """
+        [(row, score), ...] of the best `top_n` rows by cosine similarity, best
+        first. `nprobe` overrides the IVF recall/latency knob for this query.
+        """
+        if not len(self):
+            return []
+        return self.index.search(normalize_rows(query), top_n, threshold, nprobe=nprobe)
+
+    def search_batch(self, queries, top_n=5, threshold=None, nprobe=None):
+        """`search` for a (queries, dim) matrix; one list of (row, score) pairs per query."""
+        if not len(self):
+            return [[] for _ in range(len(queries))]
+        return self.index.search_batch(normalize_rows(queries), top_n, threshold, nprobe=nprobe)
+
+    @property
+    def lexical(self):
+        """BM25 index over the embedded texts, loaded on first use; stores built without one get it saved."""
+        if self._lexical is None:
+            lexical_path = os.path.join(self.path, LEXICAL_FILE) if self.path else None
+            if lexical_path and os.path.exists(lexical_path):
+                self._lexical = BM25Index.load(lexical_path)
+            else:
+                if lexical_path:
+                    print(f"{self.path} has no {LEXICAL_FILE}; building it once from the samples", file=sys.stderr)
+                self._lexical = BM25Index.build(embedding_text(self.sample(i)) for i in range(len(self)))
+                if lexical_path:
+                    try:
+                        self._lexical.save(lexical_path + ".tmp")
+                        os.replace(lexical_path + ".tmp", lexical_path)
+                    except OSError as e:
+                        print(f"Could not save {lexical_path} ({e}); rebuild the store to add it", file=sys.stderr)
+        return self._lexical
+
+    def rerank(self, query, rows, top_n=5, threshold=None):
+        """[(row, score), ...] of the best `top_n` of `rows` by cosine similarity; only those rows are read."""
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if not len(rows):
+            return []
+        scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ normalize_rows(query)
+        return [(int(rows[i]), score) for i, score in top_k(scores, top_n, threshold)]
+
+    def rerank_batch(self, queries, row_lists, top_n=5, threshold=None):
+        """
+        `rerank` for a (queries, dim) matrix, each query with its own candidate
+        rows: one matrix product against the union of the candidates, with
+        every query's scores masked to its own rows.
+        """
+        results = []
+        for start in range(0, len(row_lists), RERANK_CHUNK):
+            chunk = [np.asarray(rows, dtype=np.int64) for rows in row_lists[start:start + RERANK_CHUNK]]
+            rows = np.unique(np.concatenate(chunk))
+            if not len(rows):
+                results.extend([] for _ in chunk)
+                continue
+            matrix = np.asarray(self.embeddings[rows], dtype=np.float32)
+            scores = normalize_rows(queries[start:start + len(chunk)]) @ matrix.T
+            mask = np.ones(scores.shape, dtype=bool)
+            for i, candidates in enumerate(chunk):
+                mask[i, np.searchsorted(rows, candidates)] = False
+            scores[mask] = -np.inf
+            results.extend(
+                [(int(rows[i]), score) for i, score in hits if score > -np.inf]
+                for hits in top_k_rows(scores, top_n, threshold)
+            )
+        return results
+
+
+def encode_records(samples):
+    """Serialises samples to (bytes, offsets) in the samples.bin layout."""
+    chunks, offsets = [], [0]
+    for sample in samples:
+        data = json.dumps(sample, ensure_ascii=False).encode("utf-8")
+        chunks.append(data)
+        offsets.append(offsets[-1] + len(data))
+    return b"".join(chunks), np.asarray(offsets, dtype=np.int64)
+
+
+class StoreWriter:
+    """
+    Writes a store incrementally: rows are appended to temporary files as they
+    arrive, and `close()` assembles the final directory and swaps it into
+    place, so readers never see a half-written store.
+    """
+
+    def __init__(self, path, dtype="float32", meta=None, index="auto", nlist=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.meta = dict(meta or {})
+        self.index_kind = index
+        self.nlist = nlist
+        self.tmp_path = path + ".tmp"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self._matrix = open(os.path.join(self.tmp_path, "embeddings.raw"), "wb")
+        self._records = open(os.path.join(self.tmp_path, RECORDS_FILE), "wb")
+        self._offsets = [0]
+        self._hashes = []
+        self._lexical = BM25Builder()
+        self.dim = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def add(self, samples, embeddings, hashes=None):
+        """Appends samples (dicts without embeddings), their embedding rows and optional content hashes."""
+        if not len(samples):
+            return
+        rows = normalize_rows(embeddings).astype(self.dtype)
+        if self.dim is None:
+            self.dim = rows.shape[1]
+        self._matrix.write(rows.tobytes())
+        for sample in samples:
+            data = json.dumps(sample, ensure_ascii=False).encode("utf-8")
+            self._records.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            self._lexical.add(embedding_text(sample))
+        if hashes is not None:
+            self._hashes.extend(hashes)
+
+    def abort(self):
+        """Discards everything written so far; the existing store is left untouched."""
+        self._matrix.close()
+        self._records.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def close(self):
+        self._matrix.close()
+        self._records.close()
+
+        raw_path = os.path.join(self.tmp_path, "embeddings.raw")
+        shape = (len(self), self.dim or 0)
+        with open(os.path.join(self.tmp_path, EMBEDDINGS_FILE), "wb") as out, open(raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(out, {"descr": np.lib.format.dtype_to_descr(self.dtype),
+                                                       "fortran_order": False, "shape": shape})
+            shutil.copyfileobj(raw, out)
+        os.remove(raw_path)
+        np.save(os.path.join(self.tmp_path, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        if self._hashes and len(self._hashes) == len(self):
+            np.save(os.path.join(self.tmp_path, HASHES_FILE), np.asarray(self._hashes, dtype="S32"))
+        self._lexical.build().save(os.path.join(self.tmp_path, LEXICAL_FILE))
+
+        index_kind = "flat"
+        if len(self):
+            embeddings = np.load(os.path.join(self.tmp_path, EMBEDDINGS_FILE), mmap_mode="r")
+            index = build_index(embeddings, self.index_kind, self.nlist)
+            if index.kind != "flat":
+                index.save(self.tmp_path)
+            index_kind = index.kind
+            del embeddings, index
+
+        with open(os.path.join(self.tmp_path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(dict(self.meta, count=len(self), dim=shape[1], dtype=self.dtype.name, index=index_kind), f, indent=2)
+
+        old_path = self.path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(self.tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        print(f"Wrote {len(self)} rows to {self.path}", file=sys.stderr)
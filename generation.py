@@ -0,0 +1,143 @@
+import os
+import threading
+from contextlib import contextmanager
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+# === Helpers shared by the local SLM generation paths ===
+# Imported lazily from the request handlers, after torch is already needed.
+
+# Assisted (speculative) decoding for single-prompt generate calls:
+#   off            plain generate
+#   prompt_lookup  draft tokens copied from n-grams already in the prompt
+#                  (the RAG examples), no extra model
+#   draft          ALGOMATE_DRAFT_MODEL proposes tokens, the main model verifies
+SPECULATIVE_MODE = os.getenv("ALGOMATE_SPECULATIVE", "off")
+DRAFT_MODEL = os.getenv("ALGOMATE_DRAFT_MODEL", "dropdown")
+PROMPT_LOOKUP_TOKENS = int(os.getenv("ALGOMATE_PROMPT_LOOKUP_TOKENS", "10"))
+
+
+class RequestCriteria(StoppingCriteria):
+    """
+    Finishes each row of a batch once its request is cancelled or past its
+    deadline; the other rows keep decoding. `rows_per_context` is the
+    generate() num_return_sequences. A request whose unfinished rows are cut
+    off by its deadline gets `ctx.timed_out = True`; rows that already ended
+    (their last token is `pad_token_id`) do not count.
+    """
+
+    def __init__(self, contexts, rows_per_context=1, pad_token_id=None):
+        self.contexts = list(contexts)
+        self.rows_per_context = rows_per_context
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = []
+        for i, ctx in enumerate(self.contexts):
+            stop = ctx is not None and (ctx.cancelled or ctx.expired)
+            if stop and not ctx.cancelled and not ctx.timed_out:
+                rows = input_ids[i * self.rows_per_context:(i + 1) * self.rows_per_context, -1]
+                if self.pad_token_id is None or bool((rows != self.pad_token_id).any()):
+                    ctx.timed_out = True
+            done.extend([stop] * self.rows_per_context)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class StopStringCriteria(StoppingCriteria):
+    """
+    Finishes a row once its generated text (leading whitespace ignored)
+    contains one of `stop_strings`, e.g. the next "Instruction:" marker.
+    Only the last few tokens are decoded each step: a stop string has to
+    appear in the newest tokens the step it is completed.
+    """
+
+    def __init__(self, tokenizer, stop_strings, prompt_length):
+        self.tokenizer = tokenizer
+        self.stop_strings = list(stop_strings)
+        self.prompt_length = prompt_length
+        # A token decodes to at least one character, plus slack for the token the stop string started in
+        self.window = max(len(stop) for stop in self.stop_strings) + 4
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self.prompt_length
+        start = input_ids.shape[1] - min(generated, self.window)
+        texts = self.tokenizer.batch_decode(input_ids[:, start:], skip_special_tokens=True)
+        if generated <= self.window:
+            # The window is the whole generation so far: ignore its leading whitespace
+            texts = [text.lstrip() for text in texts]
+        done = [any(stop in text for stop in self.stop_strings) for text in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def stopping_criteria_for(*contexts, tokenizer=None, stop_strings=(), prompt_length=0, rows_per_context=1):
+    """Stopping criteria that every local `generate` call should honour."""
+    pad_token_id = tokenizer.pad_token_id if tokenizer is not None else None
+    criteria = StoppingCriteriaList([RequestCriteria(contexts, rows_per_context, pad_token_id)])
+    if stop_strings:
+        criteria.append(StopStringCriteria(tokenizer, stop_strings, prompt_length))
+    return criteria
+
+
+def trim_at_stop(text, stop_strings):
+    """Cuts generated text at the first stop string (after any leading whitespace)."""
+    start = len(text) - len(text.lstrip())
+    cuts = [i for i in (text.find(stop, start) for stop in stop_strings) if i != -1]
+    return text[:min(cuts)] if cuts else text
+
+
+@contextmanager
+def assisted_generation(registry, loaded, batch_size, mode=None):
+    """
+    Yields extra `generate` keyword arguments for assisted decoding, or {}
+    when it is off or the batch has more than one prompt (transformers only
+    supports assisted generation for batch size 1). The draft model is held
+    in the registry for the duration of the block.
+    """
+    mode = SPECULATIVE_MODE if mode is None else mode
+    if mode == "off" or batch_size != 1:
+        yield {}
+    elif mode == "prompt_lookup":
+        yield {"prompt_lookup_num_tokens": PROMPT_LOOKUP_TOKENS}
+    elif mode == "draft":
+        with registry.use(DRAFT_MODEL) as draft:
+            kwargs = {"assistant_model": draft.model}
+            if draft.tokenizer.get_vocab() != loaded.tokenizer.get_vocab():
+                # gpt-neo and codegen vocabularies differ: let generate()
+                # re-tokenize draft text for the verifier
+                kwargs.update(tokenizer=loaded.tokenizer, assistant_tokenizer=draft.tokenizer)
+            yield kwargs
+    else:
+        raise ValueError(f"Unknown ALGOMATE_SPECULATIVE mode: {mode}")
+
+
+def stream_generate(model, tokenizer, inputs, ctx, **generate_kwargs):
+    """
+    Runs `generate` for a single prompt on a helper thread and emits each
+    decoded text delta as a {"partial": ...} message as soon as it is ready.
+    Returns the full generated text (prompt excluded).
+    """
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def run():
+        try:
+            with torch.no_grad():
+                model.generate(**inputs, streamer=streamer, **generate_kwargs)
+        except BaseException as e:
+            errors.append(e)
+            # Unblock the consumer loop below
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="stream-generate", daemon=True)
+    thread.start()
+
+    pieces = []
+    for text in streamer:
+        if text:
+            pieces.append(text)
+            ctx.emit({"partial": text})
+    thread.join()
+
+    if errors:
+        raise errors[0]
+    return "".join(pieces)
@@ -1,32 +1,36 @@
 import logging
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import sys
 import torch
-import os
-from pathlib import Path
+from contextlib import contextmanager
+from model_registry import get_registry
+from inference_server import write_message
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@contextmanager
 def load_model():
+    """Yields (model, tokenizer, device) and releases the model afterwards so the registry can evict it."""
+    registry = get_registry()
     try:
-        model_path = Path(__file__).parent / "codet5-algorand"
-        logger.info(f"Loading model from {model_path}")
-        
-        tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
-        model = AutoModelForSeq2SeqLM.from_pretrained(model_path, local_files_only=True)
-        
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        logger.info(f"Using device: {device}")
-        
-        model.to(device)
-        model.eval()
-        return model, tokenizer, device
+        # Fine-tuned CodeT5 from ./codet5-algorand, managed by the shared registry
+        loaded = registry.acquire("codet5")
+        logger.info(f"Using device: {loaded.device}")
     except Exception as e:
         logger.error(f"Error loading model: {str(e)}")
         raise
+    try:
+        yield loaded.model, loaded.tokenizer, loaded.device
+    finally:
+        registry.release("codet5")
 
-def generate_code(instruction, model, tokenizer, device):
+def generate_code(instruction, model, tokenizer, device, stream=False):
+    """
+    Generates a contract for `instruction`. With `stream=True` partial text is
+    written to stdout as {"partial": ...} JSON lines while decoding; beam
+    search cannot stream, so that mode decodes greedily (num_beams=1).
+    """
     try:
         logger.info(f"Generating code for instruction: {instruction}")
         
@@ -62,6 +66,20 @@ Here's a template to follow:
         
         inputs = tokenizer(full_prompt, return_tensors="pt", truncation=True, padding=True).to(device)
         
+        if stream:
+            from generation import stream_generate
+            from inference_server import RequestContext
+
+            result = stream_generate(
+                model, tokenizer, inputs, RequestContext(),
+                max_length=1024,
+                num_beams=1,
+                do_sample=False,
+                repetition_penalty=1.2
+            )
+            logger.info("Code generation completed successfully")
+            return result
+
         # Use beam search with temperature for better quality
         with torch.no_grad():
             outputs = model.generate(
@@ -84,9 +102,6 @@ Here's a template to follow:
 
 def main():
     try:
-        # Load model
-        model, tokenizer, device = load_model()
-        
         # Enhanced prompt with more specific details
         instruction = """
 Create a PyTeal smart contract that implements a trustee-based approval system with the following requirements:
@@ -120,7 +135,12 @@ Generate complete, working code with proper structure and error handling.
 """
         
         # Generate code
-        result = generate_code(instruction, model, tokenizer, device)
+        stream = "--stream" in sys.argv
+        with load_model() as (model, tokenizer, device):
+            result = generate_code(instruction, model, tokenizer, device, stream=stream)
+        if stream:
+            write_message({"response": result})
+            return
         
         print("\n📜 Generated Output:\n", result)
         
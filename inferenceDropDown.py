@@ -1,38 +1,13 @@
-import sys
-import json
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from peft import PeftModel
-
-# Load base model and tokenizer
-base_model = "EleutherAI/gpt-neo-125M"
-tokenizer = AutoTokenizer.from_pretrained(base_model)
-model = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=torch.float32)
-
-# Load LoRA fine-tuned weights
-#model = PeftModel.from_pretrained(model, "./lora-output")
-
 import os
-script_dir = os.path.dirname(os.path.abspath(__file__))  # Directory where inferenceLora.py resides
-lora_path = os.path.join(script_dir, "lora-output")
-model = PeftModel.from_pretrained(model, lora_path)
-
-# import os
-# lora_path = os.path.abspath("./lora-output")
-# model = PeftModel.from_pretrained(model, lora_path)
-
-# Move model to CPU or GPU
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = model.to(device)
+import sys
+from inference_server import main
+from model_registry import get_registry
+from batching import BatchScheduler
 
-# Read prompt from stdin
-raw_input = sys.stdin.read()
-try:
-    data = json.loads(raw_input)
-    prompt = data["prompt"]
-except Exception as e:
-    json.dump({"error": f"Invalid input format: {str(e)}"}, sys.stdout)
-    sys.exit(1)
+# EleutherAI/gpt-neo-125M + lora-output adapter, loaded on first use and
+# evicted again when idle (see model_registry.py)
+MODEL_NAME = "dropdown"
+registry = get_registry()
 
 # Common Python completions for dropdown
 COMMON_COMPLETIONS = [
@@ -60,69 +35,115 @@ COMMON_COMPLETIONS = [
     "continue"
 ]
 
-# Tokenize and prepare input
-try:
-    # Check if we should use common completions (for empty or very short prompts)
-    if len(prompt.strip()) < 3:
-        json.dump({"suggestions": COMMON_COMPLETIONS}, sys.stdout)
-        sys.exit(0)
-    
-    # For longer prompts, use the model
-    system_prompt = """You are a helpful Python code completion assistant. 
+NUM_SUGGESTION_SEQUENCES = 5
+
+# Answer from the corpus prefix index (dropdown_trie.py) when it is confident
+USE_INDEX = os.getenv("ALGOMATE_DROPDOWN_INDEX", "1") != "0"
+
+# Only the first line of each sequence is used, so stop decoding there
+STOP_STRINGS = ["\n"]
+# Per-request wall-clock budget, overridable with "deadline_ms"; 0 disables
+DEADLINE_MS = float(os.getenv("ALGOMATE_DROPDOWN_DEADLINE_MS", "1500"))
+
+# Static part of every prompt; its KV cache is computed once (prefix_cache.py)
+SYSTEM_PROMPT = """You are a helpful Python code completion assistant. 
     Provide ONLY code completions (no explanations) for the given code context.
     Return each completion on a new line. Only include the completion text, not the prompt.
     """
-    
-    full_prompt = f"{system_prompt}\n\nCode context: {prompt}\nCompletions:\n"
-    
-    inputs = tokenizer(full_prompt, return_tensors="pt").to(device)
-    
-    with torch.no_grad():
-        output = model.generate(
-            **inputs,
-            max_new_tokens=50,
-            do_sample=True,
-            temperature=0.7,
-            top_k=30,
-            top_p=0.9,
-            num_return_sequences=5,
-            pad_token_id=tokenizer.eos_token_id,
-            no_repeat_ngram_size=2,
-        )
-    
-    # Decode and process suggestions
-    completions = set()
-    for out in output:
-        text = tokenizer.decode(out, skip_special_tokens=True)
-        # Extract only the new completion part
-        completion = text[len(full_prompt):].strip()
-        # Split by newlines and clean up
-        for line in completion.split('\n'):
-            line = line.strip()
-            if line and len(line) > 1:  # Filter out very short completions
-                completions.add(line)
-    
-    # If we didn't get good completions, fall back to common ones
-    if not completions:
-        completions = set(COMMON_COMPLETIONS)
-    
-    # Convert to list and limit number of suggestions
-    suggestions = list(completions)[:8]  # Max 8 suggestions
-    
-    # Ensure we always return at least some completions
-    if not suggestions:
-        suggestions = COMMON_COMPLETIONS[:5]
-    
-    json.dump({"suggestions": suggestions}, sys.stdout)
-    
-except Exception as e:
-    print(f"Error in dropdown completion: {str(e)}", file=sys.stderr)
-    # Fallback to common completions on error
-    json.dump({"suggestions": COMMON_COMPLETIONS[:5]}, sys.stdout)
-    sys.exit(1)
 
-    # Decode and extract new text only (removing echoed prompt)
-    
+def generate_batch(suffixes, contexts):
+    """
+    Runs one left-padded `generate` over SYSTEM_PROMPT + each suffix and
+    returns, for each, the list of its NUM_SUGGESTION_SEQUENCES sampled
+    continuations.
+    """
+    import torch
+    from generation import stopping_criteria_for, trim_at_stop
+    from prefix_cache import build_inputs
+
+    with registry.use(MODEL_NAME) as loaded:
+        tokenizer, model = loaded.tokenizer, loaded.model
+        inputs = build_inputs(loaded, SYSTEM_PROMPT, suffixes, num_return_sequences=NUM_SUGGESTION_SEQUENCES)
+
+        with torch.no_grad():
+            output = model.generate(
+                **inputs,
+                max_new_tokens=50,
+                do_sample=True,
+                temperature=0.7,
+                top_k=30,
+                top_p=0.9,
+                num_return_sequences=NUM_SUGGESTION_SEQUENCES,
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=stopping_criteria_for(
+                    *contexts, tokenizer=tokenizer, stop_strings=STOP_STRINGS,
+                    prompt_length=inputs["input_ids"].shape[1],
+                    rows_per_context=NUM_SUGGESTION_SEQUENCES,
+                ),
+                no_repeat_ngram_size=2,
+            )
+
+        # Extract only the new completion part; rows come grouped per prompt
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        texts = [trim_at_stop(tokenizer.decode(row, skip_special_tokens=True), STOP_STRINGS) for row in new_tokens]
+        return [texts[i:i + NUM_SUGGESTION_SEQUENCES] for i in range(0, len(texts), NUM_SUGGESTION_SEQUENCES)]
+
+scheduler = BatchScheduler(generate_batch, name="dropdown")
+
+def handle_request(data, ctx):
+    """Answers one {"prompt": ...} request with {"suggestions": [...]}."""
+    try:
+        prompt = data["prompt"]
+        ctx.set_deadline(float(data.get("deadline_ms", DEADLINE_MS)))
+    except Exception as e:
+        return {"error": f"Invalid input format: {str(e)}"}
+
+    # Tokenize and prepare input
+    try:
+        # Check if we should use common completions (for empty or very short prompts)
+        if len(prompt.strip()) < 3:
+            return {"suggestions": COMMON_COMPLETIONS}
+
+        # Corpus prefix index first; the model only runs when it has nothing confident
+        if USE_INDEX:
+            from dropdown_trie import get_index
+            suggestions = get_index().suggest(prompt)
+            if suggestions:
+                return {"suggestions": suggestions}
+        
+        # For longer prompts, use the model; SYSTEM_PROMPT is prepended from its cached KV state
+        prompt_suffix = f"\n\nCode context: {prompt}\nCompletions:\n"
+        
+        # Concurrent requests are batched into one generate (see generate_batch)
+        completions = set()
+        for completion in scheduler.submit(prompt_suffix, ctx):
+            # Split by newlines and clean up
+            for line in completion.strip().split('\n'):
+                line = line.strip()
+                if line and len(line) > 1:  # Filter out very short completions
+                    completions.add(line)
+        
+        # If we didn't get good completions, fall back to common ones
+        if not completions:
+            completions = set(COMMON_COMPLETIONS)
+        
+        # Convert to list and limit number of suggestions
+        suggestions = list(completions)[:8]  # Max 8 suggestions
+        
+        # Ensure we always return at least some completions
+        if not suggestions:
+            suggestions = COMMON_COMPLETIONS[:5]
+        
+        return {"suggestions": suggestions}
+        
+    except Exception as e:
+        print(f"Error in dropdown completion: {str(e)}", file=sys.stderr)
+        # Fallback to common completions on error
+        return {"suggestions": COMMON_COMPLETIONS[:5]}
+
+if __name__ == "__main__":
+    # One worker per batch slot so concurrent requests can meet in the scheduler
+    main(handle_request, workers=scheduler.max_batch_size)
 
 
 # import sys
@@ -1,10 +1,10 @@
 import sys
 import json
 import os
-import torch
 import re
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from peft import PeftModel
+from inference_server import main
+from model_registry import get_registry
+from batching import BatchScheduler
 
 # with open("data/samples.jsonl", "r", encoding="utf-8") as f:
 #     for i, line in enumerate(f, 1):
@@ -15,7 +15,15 @@ from peft import PeftModel
 
 # === RAG SETUP ===
 SAMPLES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "samples.jsonl")
+BM25_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "samples.bm25.json")
 NUM_CONTEXT_SAMPLES = 1
+# The top BM25 candidates are reranked by MiniLM similarity against their
+# precomputed rows of the vector store (retrieval.rerank_samples), so only the
+# query is encoded; ALGOMATE_CODEGEN_RERANK=0 keeps BM25 alone
+DENSE_RERANK = os.getenv("ALGOMATE_CODEGEN_RERANK", "1") == "1"
+RERANK_CANDIDATES = int(os.getenv("ALGOMATE_CODEGEN_RERANK_CANDIDATES", "20"))
+# Token budget for retrieved examples (codegen-350M has a 2048-token window)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ALGOMATE_CODEGEN_CONTEXT_TOKENS", "768"))
 
 def load_samples(filepath):
     samples = []
@@ -30,16 +38,30 @@ def load_samples(filepath):
                 print(f"Error decoding JSON: {e}", file=sys.stderr)
     return samples
 
+_lexical_indexes = {}
+
+def get_lexical_index(samples):
+    """BM25 index over the sample instructions, built once per sample list (all_samples is saved to BM25_INDEX_FILE)."""
+    cached = _lexical_indexes.get(id(samples))
+    if cached is None or cached[0] is not samples:
+        from bm25_index import BM25Index, load_or_build
+        texts = [sample.get("instruction", "") for sample in samples]
+        index = load_or_build(BM25_INDEX_FILE, texts) if samples is all_samples else BM25Index.build(texts)
+        cached = _lexical_indexes[id(samples)] = (samples, index)
+    return cached[1]
+
 def find_matching_samples(user_instruction, samples, top_n=NUM_CONTEXT_SAMPLES):
-    user_instruction_lower = user_instruction.lower()
-    matches = []
-    for sample in samples:
-        sample_instruction = sample.get("instruction", "").lower()
-        shared_words = set(user_instruction_lower.split()) & set(sample_instruction.split())
-        if shared_words:
-            matches.append((len(shared_words), sample))
-    matches.sort(key=lambda x: x[0], reverse=True)
-    return [sample for _, sample in matches[:top_n]]
+    # Only the posting lists of the query's terms are scanned (bm25_index.py)
+    index = get_lexical_index(samples)
+    limit = max(top_n, RERANK_CANDIDATES) if DENSE_RERANK else top_n
+    candidates = [samples[doc] for doc, _ in index.search(user_instruction, limit)]
+    if DENSE_RERANK and len(candidates) > 1:
+        from retrieval import rerank_samples
+        reranked = rerank_samples(user_instruction, candidates, top_n)
+        if reranked:
+            return reranked
+    # Nothing cleared the similarity threshold: keep the best keyword match
+    return candidates[:top_n]
 
 # === SLM SETUP ===
 #base_model = "EleutherAI/gpt-neo-125M"
@@ -47,66 +69,139 @@ def find_matching_samples(user_instruction, samples, top_n=NUM_CONTEXT_SAMPLES):
 # tokenizer = AutoTokenizer.from_pretrained(base_model)
 # model = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=torch.float32)
 
-model_name = "Salesforce/codegen-350M-mono"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-tokenizer.pad_token = tokenizer.eos_token
-
-model = AutoModelForCausalLM.from_pretrained(model_name)
-
-lora_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trainedModel")
-model = PeftModel.from_pretrained(model, lora_path)
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = model.to(device)
-
-# === Read Prompt from Stdin ===
-raw_input = sys.stdin.read()
-try:
-    data = json.loads(raw_input)
-    prompt = data["prompt"].strip()
-except Exception as e:
-    json.dump({"error": f"Invalid input format: {str(e)}"}, sys.stdout)
-    sys.exit(1)
+# Salesforce/codegen-350M-mono + trainedModel adapter, loaded on first use and
+# evicted again when idle (see model_registry.py)
+MODEL_NAME = "codegen"
+registry = get_registry()
+
+GENERATION_KWARGS = dict(
+    max_new_tokens=200,
+    do_sample=True,
+    temperature=0.5,
+    top_k=20,
+    top_p=0.7,
+)
+
+# Static part of every prompt; its KV cache is computed once (prefix_cache.py)
+SYSTEM_PROMPT = "You are a helpful coding assistant. Provide only code for the following task."
+
+# The model tends to run on into another example; stop decoding there
+STOP_STRINGS = ["\nInstruction:", "\nContext Example"]
+# Per-request wall-clock budget, overridable with "deadline_ms"; 0 disables
+DEADLINE_MS = float(os.getenv("ALGOMATE_CODEGEN_DEADLINE_MS", "0"))
+
+def generate_batch(suffixes, contexts):
+    """
+    Runs one left-padded `generate` over SYSTEM_PROMPT + each suffix and
+    returns the new text for each.
+    """
+    import torch
+    from generation import stopping_criteria_for, assisted_generation, trim_at_stop
+    from prefix_cache import build_inputs
+
+    with registry.use(MODEL_NAME) as loaded, assisted_generation(registry, loaded, len(suffixes)) as assist:
+        tokenizer, model = loaded.tokenizer, loaded.model
+        inputs = build_inputs(loaded, SYSTEM_PROMPT, suffixes, reuse_prefix=not assist)
+        #inputs = tokenizer(final_prompt, return_tensors="pt", truncation=True, max_length=2048).to(device)
+
+        with torch.no_grad():
+            output = model.generate(
+                **inputs,
+                **GENERATION_KWARGS,
+                **assist,
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=stopping_criteria_for(
+                    *contexts, tokenizer=tokenizer, stop_strings=STOP_STRINGS,
+                    prompt_length=inputs["input_ids"].shape[1],
+                ),
+            )
+        # Left padding lines every prompt up at the same position
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        return [trim_at_stop(tokenizer.decode(row, skip_special_tokens=True), STOP_STRINGS) for row in new_tokens]
+
+scheduler = BatchScheduler(generate_batch, name="codegen")
+
+def generate_streaming(suffix, ctx):
+    """Generates for one prompt outside the batcher, emitting partial text as it decodes."""
+    from generation import stream_generate, stopping_criteria_for, assisted_generation, trim_at_stop
+    from prefix_cache import build_inputs
+
+    with registry.use(MODEL_NAME) as loaded, assisted_generation(registry, loaded, 1) as assist:
+        tokenizer, model = loaded.tokenizer, loaded.model
+        inputs = build_inputs(loaded, SYSTEM_PROMPT, [suffix], reuse_prefix=not assist)
+        text = stream_generate(
+            model, tokenizer, inputs, ctx,
+            **GENERATION_KWARGS,
+            **assist,
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=stopping_criteria_for(
+                ctx, tokenizer=tokenizer, stop_strings=STOP_STRINGS,
+                prompt_length=inputs["input_ids"].shape[1],
+            ),
+        )
+        return trim_at_stop(text, STOP_STRINGS)
 
-# === RAG: Inject Context ===
+# === RAG: Load samples once ===
 all_samples = load_samples(SAMPLES_FILE)
-context_examples_str = ""
-
-if all_samples:
-    matching_samples = find_matching_samples(prompt, all_samples, NUM_CONTEXT_SAMPLES)
-    for i, sample in enumerate(matching_samples):
-        context_examples_str += f"\nContext Example {i+1}:\nInstruction: {sample.get('instruction', '')}\nResponse:\n{sample.get('output', '')}\n"
-        # if i==0:
-        #     print(sample)
-
-# === Final Prompt for SLM ===
-system_prompt = "You are a helpful coding assistant. Provide only code for the following task."
-final_prompt = f"{system_prompt}\n{context_examples_str}\n\nInstruction: {prompt}\nResponse:\n"
-
-# === Run Inference ===
-try:
-    inputs = tokenizer(final_prompt, return_tensors="pt").to(device)
-    #inputs = tokenizer(final_prompt, return_tensors="pt", truncation=True, max_length=2048).to(device)
-
-    with torch.no_grad():
-        output = model.generate(
-            **inputs,
-            max_new_tokens=200,
-            do_sample=True,
-            temperature=0.5,
-            top_k=20,
-            top_p=0.7,
-            pad_token_id=tokenizer.eos_token_id,
-        )
-    decoded = tokenizer.decode(output[0], skip_special_tokens=True)
-    completion = decoded[len(final_prompt):].strip()
-
-    # Remove any code block formatting if it was copied from training data
-    match = re.search(r"```(?:[Pp]ython)?\s*([\s\S]+?)```", completion)
-    if match:
-        completion = match.group(1).strip()
-
-    json.dump({"response": completion}, sys.stdout)
-except Exception as e:
-    json.dump({"error": f"Inference error: {str(e)}"}, sys.stdout)
-    sys.exit(1)
+
+def render_example(i, sample, output):
+    return f"\nContext Example {i+1}:\nInstruction: {sample.get('instruction', '')}\nResponse:\n{output}\n"
+
+def build_prompt_suffix(prompt):
+    """Request-specific part of the prompt: retrieved examples plus the instruction."""
+    from prompt_packer import pack_examples, tokenizer_counter
+
+    # === RAG: Inject Context ===
+    context_examples_str = ""
+
+    if all_samples:
+        matching_samples = find_matching_samples(prompt, all_samples, NUM_CONTEXT_SAMPLES)
+        # Examples are cut to CONTEXT_TOKEN_BUDGET codegen tokens so prefill stays bounded
+        # (only the tokenizer is needed, not the model weights)
+        count_tokens, truncate = tokenizer_counter(registry.tokenizer(MODEL_NAME))
+        examples, _ = pack_examples(matching_samples, render_example, CONTEXT_TOKEN_BUDGET, count_tokens, truncate)
+        context_examples_str = "".join(examples)
+
+    # === Final Prompt for SLM ===
+    # SYSTEM_PROMPT is prepended in generate_batch/generate_streaming from its cached KV state
+    return f"\n{context_examples_str}\n\nInstruction: {prompt}\nResponse:\n"
+
+def handle_request(data, ctx):
+    """
+    Answers one {"prompt": ...} request with {"response": ...} or {"error": ...}.
+    With "stream": true, {"partial": ...} messages are emitted first. If the
+    deadline stops generation before it finished on its own, the text so far
+    is returned with "timed_out": true.
+    """
+    try:
+        prompt = data["prompt"].strip()
+        ctx.set_deadline(float(data.get("deadline_ms", DEADLINE_MS)))
+    except Exception as e:
+        return {"error": f"Invalid input format: {str(e)}"}
+
+    prompt_suffix = build_prompt_suffix(prompt)
+
+    # === Run Inference ===
+    try:
+        if data.get("stream"):
+            # Partial tokens are written as {"partial": ...} lines while decoding
+            completion = generate_streaming(prompt_suffix, ctx).strip()
+        else:
+            # Concurrent requests are batched into one generate (see generate_batch)
+            completion = scheduler.submit(prompt_suffix, ctx).strip()
+
+        # Remove any code block formatting if it was copied from training data
+        match = re.search(r"```(?:[Pp]ython)?\s*([\s\S]+?)```", completion)
+        if match:
+            completion = match.group(1).strip()
+
+        result = {"response": completion}
+        if ctx.timed_out:
+            result["timed_out"] = True
+        return result
+    except Exception as e:
+        return {"error": f"Inference error: {str(e)}"}
+
+if __name__ == "__main__":
+    # One worker per batch slot so concurrent requests can meet in the scheduler
+    main(handle_request, workers=scheduler.max_batch_size)
@@ -0,0 +1,225 @@
+import sys
+import json
+import queue
+import time
+import threading
+
+# === Request/response plumbing shared by the inference scripts ===
+# Every script exposes a `handle_request(data, ctx)` function that turns one
+# JSON request into one JSON-serialisable dict. `main()` then runs it either
+# once (the original "python script.py < request.json" mode) or as a
+# long-lived server that answers newline-delimited requests on stdin/stdout,
+# so models, embeddings and samples are only loaded once per process.
+#
+# In server mode a request may also carry:
+#   "id"             echoed back on its response
+#   "supersede_key"  a newer request with the same key (e.g. the same document)
+#                    cancels this one, queued or in flight
+# and {"cancel": <id>} cancels a single request. Cancelled requests are
+# answered with {"id": ..., "cancelled": true}.
+#
+# Handlers that stream (requests with "stream": true) call ctx.emit() with
+# {"partial": <text>} messages before returning their final response.
+
+SERVER_FLAG = "--server"
+
+_write_lock = threading.Lock()
+
+
+class RequestCancelled(BaseException):
+    """
+    Raised inside a handler once its request has been cancelled or superseded.
+
+    Like asyncio.CancelledError it derives from BaseException, so the broad
+    `except Exception` fallbacks in the handlers don't turn it into an error.
+    """
+
+
+class RequestContext:
+    """Per-request state handed to handlers so they can stop early."""
+
+    def __init__(self, request_id=None, key=None):
+        self.id = request_id
+        self.key = key
+        self._cancelled = threading.Event()
+        # time.monotonic() after which generation should stop and return what it has
+        self.deadline = None
+        # Set by generation.RequestCriteria when the deadline cut decoding short
+        self.timed_out = False
+
+    def emit(self, message):
+        """Writes an intermediate message (e.g. a streamed partial) for this request."""
+        if self.cancelled:
+            return
+        if self.id is not None:
+            message = dict(message, id=self.id)
+        write_message(message)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def set_deadline(self, milliseconds):
+        """Gives the request a wall-clock budget from now; 0 or None means no deadline."""
+        self.deadline = time.monotonic() + milliseconds / 1000.0 if milliseconds else None
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def check(self):
+        """Raises RequestCancelled if the request is no longer wanted."""
+        if self._cancelled.is_set():
+            raise RequestCancelled()
+
+    def run_cancellable(self, fn, *args, **kwargs):
+        """
+        Runs a blocking call (e.g. a Gemini round-trip) on a helper thread and
+        stops waiting for it as soon as the request is cancelled, so the worker
+        is free for the newer request. The abandoned call's result is dropped.
+        """
+        self.check()
+        outcome = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                outcome["value"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=target, daemon=True).start()
+        while not done.wait(0.05):
+            self.check()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["value"]
+
+
+def write_message(message):
+    """Writes one JSON line to stdout and flushes it straight away."""
+    with _write_lock:
+        sys.stdout.write(json.dumps(message) + "\n")
+        sys.stdout.flush()
+
+
+def run_once(handler):
+    """Reads a single JSON request from stdin and answers it."""
+    raw_input = sys.stdin.read()
+    try:
+        data = json.loads(raw_input)
+    except Exception as e:
+        json.dump({"error": f"Invalid input format: {str(e)}"}, sys.stdout)
+        sys.exit(1)
+    if not isinstance(data, dict):
+        json.dump({"error": "Invalid input format: expected a JSON object"}, sys.stdout)
+        sys.exit(1)
+
+    try:
+        result = handler(data, RequestContext())
+    except Exception as e:
+        print(f"Error handling request: {str(e)}", file=sys.stderr)
+        result = {"error": f"Inference error: {str(e)}"}
+    json.dump(result, sys.stdout)
+    if "error" in result:
+        sys.exit(1)
+
+
+def _answer(handler, request, ctx):
+    if ctx.cancelled:
+        return {"cancelled": True}
+    try:
+        result = handler(request, ctx)
+    except RequestCancelled:
+        return {"cancelled": True}
+    except Exception as e:
+        print(f"Error handling request: {str(e)}", file=sys.stderr)
+        return {"error": f"Inference error: {str(e)}"}
+    # Finished after being superseded: the caller has already moved on.
+    if ctx.cancelled:
+        return {"cancelled": True}
+    return result
+
+
+def serve(handler, workers=1):
+    """
+    Answers newline-delimited JSON requests until stdin is closed.
+
+    stdin is read on the calling thread while `workers` threads run the
+    handler, so cancel messages and superseding requests are seen while an
+    older request is still being processed.
+    """
+    pending = queue.Queue()
+    active = {}
+    latest_by_key = {}
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            request, ctx = item
+            result = _answer(handler, request, ctx)
+            with lock:
+                active.pop(ctx.id, None)
+                if ctx.key is not None and latest_by_key.get(ctx.key) is ctx:
+                    del latest_by_key[ctx.key]
+            if ctx.id is not None:
+                result["id"] = ctx.id
+            write_message(result)
+
+    threads = [threading.Thread(target=work, name=f"inference-worker-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            write_message({"error": f"Invalid input format: {str(e)}"})
+            continue
+        if not isinstance(request, dict):
+            write_message({"error": "Invalid input format: expected a JSON object"})
+            continue
+
+        if "cancel" in request:
+            with lock:
+                ctx = active.get(request["cancel"])
+            if ctx is not None:
+                ctx.cancel()
+            continue
+
+        ctx = RequestContext(request.get("id"), request.get("supersede_key"))
+        with lock:
+            if ctx.id is not None:
+                active[ctx.id] = ctx
+            if ctx.key is not None:
+                previous = latest_by_key.get(ctx.key)
+                if previous is not None:
+                    previous.cancel()
+                latest_by_key[ctx.key] = ctx
+        pending.put((request, ctx))
+
+    # stdin closed: let the workers finish what is queued, then stop.
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+
+
+def main(handler, argv=None, workers=1):
+    """Runs `handler` in server mode when started with --server, otherwise once."""
+    argv = sys.argv[1:] if argv is None else argv
+    if SERVER_FLAG in argv:
+        serve(handler, workers=workers)
+    else:
+        run_once(handler)
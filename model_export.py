@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+from model_registry import MODEL_SPECS, SCRIPT_DIR, model_size_bytes
+
+# === Offline model preparation ===
+# `export` merges a LoRA adapter into its base model and writes a standalone
+# safetensors checkpoint under merged/; the registry loads that directly
+# (memory-mapped, no PEFT wrapper) whenever it is present and up to date.
+# `quantize` builds an int8 dynamically quantized copy for CPU inference,
+# cached under quantized/ and used when ALGOMATE_QUANTIZE=1. Usage:
+#
+#     python model_export.py export codegen
+#     python model_export.py quantize codegen
+#     python model_export.py evaluate codegen --limit 20
+
+MERGED_DIR = os.path.join(SCRIPT_DIR, "merged")
+QUANTIZED_DIR = os.path.join(SCRIPT_DIR, "quantized")
+FINGERPRINT_FILE = "export_meta.json"
+SAMPLES_FILE = os.path.join(SCRIPT_DIR, "data", "samples.jsonl")
+
+
+def adapter_fingerprint(spec):
+    """Hash of the base model name and adapter files, used to invalidate cached artifacts."""
+    digest = hashlib.sha256(spec["base_model"].encode("utf-8"))
+    adapter = spec.get("adapter")
+    if adapter and os.path.isdir(adapter):
+        for filename in sorted(os.listdir(adapter)):
+            if filename.startswith("adapter_"):
+                with open(os.path.join(adapter, filename), "rb") as f:
+                    digest.update(filename.encode("utf-8"))
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def export_meta(spec):
+    return {
+        "base_model": spec["base_model"],
+        "adapter": spec.get("adapter"),
+        "fingerprint": adapter_fingerprint(spec),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def merged_path(name):
+    return os.path.join(MERGED_DIR, name)
+
+
+def merged_checkpoint(name, spec=None):
+    """Path of the exported checkpoint for `name` if it exists and matches the current adapter, else None."""
+    spec = spec or MODEL_SPECS[name]
+    meta_path = os.path.join(merged_path(name), FINGERPRINT_FILE)
+    if not spec.get("adapter") or not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("fingerprint") != adapter_fingerprint(spec):
+        print(f"Merged checkpoint for '{name}' is stale, re-run `model_export.py export {name}`", file=sys.stderr)
+        return None
+    return merged_path(name)
+
+
+def load_merged_model(spec, name=None):
+    """Loads base model + adapter and folds the LoRA weights into the base linear layers."""
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    checkpoint = merged_checkpoint(name, spec) if name else None
+    if checkpoint:
+        model = AutoModelForCausalLM.from_pretrained(checkpoint, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        model.eval()
+        return model
+
+    model = AutoModelForCausalLM.from_pretrained(spec["base_model"], torch_dtype=torch.float32)
+    if spec.get("adapter"):
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, spec["adapter"])
+        model = model.merge_and_unload()
+    model.eval()
+    return model
+
+
+def export_merged(name, spec=None):
+    """Writes the merged model and its tokenizer to merged/<name> as safetensors."""
+    from transformers import AutoTokenizer
+
+    spec = spec or MODEL_SPECS[name]
+    if spec["kind"] != "causal" or not spec.get("adapter"):
+        raise ValueError(f"Only causal models with an adapter can be merged, not {name}")
+
+    print(f"Merging '{name}'...", file=sys.stderr)
+    model = load_merged_model(spec)
+    out_dir = merged_path(name)
+    os.makedirs(out_dir, exist_ok=True)
+    model.save_pretrained(out_dir, safe_serialization=True)
+    AutoTokenizer.from_pretrained(spec["base_model"]).save_pretrained(out_dir)
+    # Written last, so an interrupted export is never picked up
+    with open(os.path.join(out_dir, FINGERPRINT_FILE), "w", encoding="utf-8") as f:
+        json.dump(export_meta(spec), f, indent=2)
+    return out_dir
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of every nn.Linear (weights int8, activations quantized on the fly)."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantized_paths(name):
+    return (
+        os.path.join(QUANTIZED_DIR, f"{name}.int8.pt"),
+        os.path.join(QUANTIZED_DIR, f"{name}.int8.json"),
+    )
+
+
+def build_quantized(name, spec=None):
+    """Merges, quantizes and saves model `name`. Returns the quantized model."""
+    import torch
+
+    spec = spec or MODEL_SPECS[name]
+    if spec["kind"] != "causal":
+        raise ValueError(f"Int8 export only supports causal models, not {name}")
+
+    print(f"Merging and quantizing '{name}'...", file=sys.stderr)
+    model = quantize_int8(load_merged_model(spec, name))
+
+    model_path, meta_path = quantized_paths(name)
+    os.makedirs(QUANTIZED_DIR, exist_ok=True)
+    torch.save(model, model_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(export_meta(spec), f, indent=2)
+    return model
+
+
+def load_quantized(name, spec=None):
+    """Loads the cached int8 artifact for `name`, rebuilding it if missing or stale."""
+    import torch
+
+    spec = spec or MODEL_SPECS[name]
+    model_path, meta_path = quantized_paths(name)
+    if os.path.exists(model_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") == adapter_fingerprint(spec):
+            # Full module pickle: quantized modules can't be rebuilt from a plain state dict
+            model = torch.load(model_path, weights_only=False)
+            model.eval()
+            return model
+        print(f"Quantized '{name}' is stale, rebuilding", file=sys.stderr)
+    return build_quantized(name, spec)
+
+
+# === Quality report ===
+
+def held_out_samples(path, limit):
+    """The last `limit` records of samples.jsonl, which the LoRA runs don't train on."""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                sample = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if sample.get("instruction") and sample.get("output"):
+                samples.append(sample)
+    return samples[-limit:]
+
+
+def score_model(model, tokenizer, samples, max_tokens):
+    """Teacher-forced loss over each sample's output, plus greedy next-token predictions."""
+    import torch
+
+    total_loss, total_tokens, predictions = 0.0, 0, []
+    start = time.perf_counter()
+    for sample in samples:
+        prompt = f"Instruction: {sample['instruction']}\nResponse:\n"
+        prompt_ids = tokenizer(prompt, return_tensors="pt").input_ids
+        output_ids = tokenizer(sample["output"], return_tensors="pt", add_special_tokens=False).input_ids
+        input_ids = torch.cat([prompt_ids, output_ids], dim=1)[:, :max_tokens]
+        labels = input_ids.clone()
+        labels[:, :prompt_ids.shape[1]] = -100
+
+        with torch.no_grad():
+            out = model(input_ids=input_ids, labels=labels)
+        n = int((labels[:, 1:] != -100).sum())
+        if n:
+            total_loss += float(out.loss) * n
+            total_tokens += n
+        predictions.append(out.logits[0, prompt_ids.shape[1] - 1:-1].argmax(-1))
+    elapsed = time.perf_counter() - start
+
+    mean_loss = total_loss / max(total_tokens, 1)
+    return {
+        "mean_loss": round(mean_loss, 4),
+        "perplexity": round(float(torch.exp(torch.tensor(mean_loss))), 3),
+        "tokens": total_tokens,
+        "seconds": round(elapsed, 2),
+        "tokens_per_second": round(total_tokens / elapsed, 1) if elapsed else None,
+    }, predictions
+
+
+def evaluate(name, samples_path=SAMPLES_FILE, limit=20, max_tokens=512):
+    """Compares the float32 merged model and its int8 copy on a held-out slice."""
+    from transformers import AutoTokenizer
+
+    spec = MODEL_SPECS[name]
+    tokenizer = AutoTokenizer.from_pretrained(spec["base_model"])
+    samples = held_out_samples(samples_path, limit)
+    if not samples:
+        raise ValueError(f"No usable samples in {samples_path}")
+
+    fp32 = load_merged_model(spec, name)
+    fp32_scores, fp32_preds = score_model(fp32, tokenizer, samples, max_tokens)
+    fp32_size = model_size_bytes(fp32)
+    del fp32
+
+    int8 = load_quantized(name, spec)
+    int8_scores, int8_preds = score_model(int8, tokenizer, samples, max_tokens)
+    int8_size = model_size_bytes(int8)
+
+    agree = sum(int((a == b).sum()) for a, b in zip(fp32_preds, int8_preds))
+    total = sum(a.numel() for a in fp32_preds)
+    return {
+        "model": name,
+        "samples": len(samples),
+        "fp32": dict(fp32_scores, size_mb=round(fp32_size / (1024 * 1024), 1)),
+        "int8": dict(int8_scores, size_mb=round(int8_size / (1024 * 1024), 1)),
+        "perplexity_delta": round(int8_scores["perplexity"] - fp32_scores["perplexity"], 3),
+        "greedy_token_agreement": round(agree / max(total, 1), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare merged/quantized models for CPU inference.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Merge the adapter into a standalone safetensors checkpoint")
+    export.add_argument("name", choices=sorted(MODEL_SPECS))
+
+    quantize = sub.add_parser("quantize", help="Merge the adapter and cache an int8 copy")
+    quantize.add_argument("name", choices=sorted(MODEL_SPECS))
+
+    report = sub.add_parser("evaluate", help="Report int8 vs float32 quality on held-out samples")
+    report.add_argument("name", choices=sorted(MODEL_SPECS))
+    report.add_argument("--samples", default=SAMPLES_FILE)
+    report.add_argument("--limit", type=int, default=20)
+    report.add_argument("--max-tokens", type=int, default=512)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        print(f"Saved {export_merged(args.name)}")
+    elif args.command == "quantize":
+        build_quantized(args.name)
+        print(f"Saved {quantized_paths(args.name)[0]}")
+    elif args.command == "evaluate":
+        print(json.dumps(evaluate(args.name, args.samples, args.limit, args.max_tokens), indent=2))
+
+
+if __name__ == "__main__":
+    main()
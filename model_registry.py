@@ -0,0 +1,316 @@
+import os
+import sys
+import gc
+import time
+import threading
+from contextlib import contextmanager
+
+# === Shared model registry ===
+# Models are loaded the first time a script asks for them, stay resident while
+# they are in use, and are unloaded again once they have been idle for longer
+# than ALGOMATE_MODEL_IDLE_SECONDS or when the resident weights would exceed
+# ALGOMATE_MODEL_MEMORY_MB (0 disables the budget). Room for a model is made
+# before it loads, from its expected size: its measured size once loaded, the
+# weight files it is read from, or the spec's size_mb. ALGOMATE_QUANTIZE=1
+# serves the LoRA models from a merged int8 copy on CPU; otherwise a merged
+# checkpoint exported by model_export.py is preferred over base model + adapter.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_IDLE_SECONDS = float(os.getenv("ALGOMATE_MODEL_IDLE_SECONDS", "300"))
+DEFAULT_MEMORY_BUDGET_MB = float(os.getenv("ALGOMATE_MODEL_MEMORY_MB", "0"))
+QUANTIZE = os.getenv("ALGOMATE_QUANTIZE", "0") == "1"
+WEIGHT_FILE_EXTENSIONS = (".safetensors", ".bin", ".pt")
+
+MODEL_SPECS = {
+    # Contract generation (inferenceSLM.py)
+    "codegen": {
+        "base_model": "Salesforce/codegen-350M-mono",
+        "adapter": os.path.join(SCRIPT_DIR, "trainedModel"),
+        "kind": "causal",
+        # float32 weights, for the memory budget when the files are not local
+        "size_mb": 1400,
+    },
+    # Dropdown suggestions (inferenceDropDown.py)
+    "dropdown": {
+        "base_model": "EleutherAI/gpt-neo-125M",
+        "adapter": os.path.join(SCRIPT_DIR, "lora-output"),
+        "kind": "causal",
+        "size_mb": 500,
+    },
+    # Fine-tuned CodeT5 (inference2.py)
+    "codet5": {
+        "base_model": os.path.join(SCRIPT_DIR, "codet5-algorand"),
+        "kind": "seq2seq",
+        "local_files_only": True,
+    },
+}
+
+
+class LoadedModel:
+    """A resident model together with its tokenizer and bookkeeping."""
+
+    def __init__(self, name, model, tokenizer, device, size_bytes):
+        self.name = name
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.size_bytes = size_bytes
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        # Static-prefix past-key-values (prefix_cache.py), dropped with the model
+        self.prefix_cache = {}
+
+
+def model_size_bytes(model):
+    """Bytes held by a model's weights, including packed int8 weights of quantized layers."""
+    def size(value):
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        if hasattr(value, "element_size"):
+            return value.numel() * value.element_size()
+        return 0
+
+    return sum(size(value) for value in model.state_dict().values())
+
+
+def weight_files_bytes(path):
+    """Bytes of the weight files at `path` (a checkpoint directory or a single file); 0 if there are none."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    if not os.path.isdir(path):
+        return 0
+    return sum(os.path.getsize(os.path.join(path, filename))
+               for filename in os.listdir(path) if filename.endswith(WEIGHT_FILE_EXTENSIONS))
+
+
+def estimate_size_bytes(name, spec):
+    """Expected resident bytes of a model that is not loaded yet, from the files it would be loaded from."""
+    from model_export import merged_path, quantized_paths
+
+    if spec.get("quantize", QUANTIZE) and spec["kind"] == "causal":
+        size = weight_files_bytes(quantized_paths(name)[0])
+        if size:
+            return size
+    size = weight_files_bytes(merged_path(name)) if spec.get("adapter") else 0
+    if not size and weight_files_bytes(spec["base_model"]):
+        size = weight_files_bytes(spec["base_model"]) + weight_files_bytes(spec.get("adapter") or "")
+    return size or int(spec.get("size_mb", 0) * 1024 * 1024)
+
+
+def load_tokenizer_from_spec(spec):
+    """Loads the tokenizer described by `spec`, set up for batched generation."""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(spec["base_model"], local_files_only=spec.get("local_files_only", False))
+    if spec["kind"] == "causal":
+        # Batched decoder-only generation needs prompts padded on the left
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def load_model_from_spec(spec, name=None):
+    """Loads the base model, tokenizer and (optional) PEFT adapter described by `spec`."""
+    import torch
+    from transformers import AutoModelForCausalLM, AutoModelForSeq2SeqLM
+
+    base_model = spec["base_model"]
+    local_files_only = spec.get("local_files_only", False)
+
+    tokenizer = load_tokenizer_from_spec(spec)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if spec.get("quantize", QUANTIZE) and spec["kind"] == "causal" and name is not None:
+        if device.type == "cpu":
+            from model_export import load_quantized
+            return load_quantized(name, spec), tokenizer, device
+        print(f"Ignoring int8 mode for '{name}': quantized kernels are CPU-only", file=sys.stderr)
+
+    model_class = AutoModelForSeq2SeqLM if spec["kind"] == "seq2seq" else AutoModelForCausalLM
+    from model_export import merged_checkpoint
+    checkpoint = merged_checkpoint(name, spec) if name is not None else None
+    if checkpoint:
+        # Exported with the adapter folded in: safetensors are memory-mapped
+        # and the forward pass has no LoRA matmuls.
+        model = model_class.from_pretrained(checkpoint, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    else:
+        model = model_class.from_pretrained(base_model, torch_dtype=torch.float32, local_files_only=local_files_only)
+        if spec.get("adapter"):
+            from peft import PeftModel
+            model = PeftModel.from_pretrained(model, spec["adapter"])
+
+    model = model.to(device)
+    model.eval()
+    return model, tokenizer, device
+
+
+class ModelRegistry:
+    """
+    Lazily loads models by name and evicts them when idle or over budget.
+
+    Use `with registry.use(name) as loaded:` around inference so a model is
+    never evicted while a request is running on it.
+    """
+
+    def __init__(self, specs=None, idle_seconds=DEFAULT_IDLE_SECONDS, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+        self.specs = dict(MODEL_SPECS if specs is None else specs)
+        self.idle_seconds = idle_seconds
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._loaded = {}
+        self._tokenizers = {}
+        # Measured size of every model loaded so far, the best estimate for a reload
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self._reaper = None
+
+    def acquire(self, name):
+        """Returns the loaded model `name`, loading it if needed, and marks it in use."""
+        with self._lock:
+            if name not in self.specs:
+                raise KeyError(f"Unknown model: {name}")
+
+            self.evict_idle()
+            loaded = self._loaded.get(name)
+            if loaded is None:
+                # Evict before loading, so the peak stays within the budget too
+                self._enforce_budget(self.expected_bytes(name))
+                print(f"Loading model '{name}'...", file=sys.stderr)
+                model, tokenizer, device = load_model_from_spec(self.specs[name], name)
+                loaded = LoadedModel(name, model, tokenizer, device, model_size_bytes(model))
+                self._loaded[name] = loaded
+                self._sizes[name] = loaded.size_bytes
+                self._start_reaper()
+
+            loaded.in_use += 1
+            loaded.last_used = time.monotonic()
+            self._enforce_budget()
+            return loaded
+
+    def expected_bytes(self, name):
+        """Bytes model `name` takes once loaded: its last measured size, else an estimate (estimate_size_bytes)."""
+        if self.memory_budget_bytes <= 0:
+            return 0
+        if name not in self._sizes:
+            self._sizes[name] = estimate_size_bytes(name, self.specs[name])
+        return self._sizes[name]
+
+    def tokenizer(self, name):
+        """
+        The tokenizer of model `name` without loading its weights (e.g. to
+        count prompt tokens); the resident model's own one when it is loaded.
+        """
+        with self._lock:
+            if name not in self.specs:
+                raise KeyError(f"Unknown model: {name}")
+            loaded = self._loaded.get(name)
+            if loaded is not None:
+                return loaded.tokenizer
+            if name not in self._tokenizers:
+                self._tokenizers[name] = load_tokenizer_from_spec(self.specs[name])
+            return self._tokenizers[name]
+
+    def release(self, name):
+        """Marks one use of `name` as finished."""
+        with self._lock:
+            loaded = self._loaded.get(name)
+            if loaded is not None:
+                loaded.in_use = max(0, loaded.in_use - 1)
+                loaded.last_used = time.monotonic()
+
+    @contextmanager
+    def use(self, name):
+        loaded = self.acquire(name)
+        try:
+            yield loaded
+        finally:
+            self.release(name)
+
+    def unload(self, name):
+        """Drops `name` from memory if it is not in use. Returns True if it was unloaded."""
+        with self._lock:
+            loaded = self._loaded.get(name)
+            if loaded is None or loaded.in_use:
+                return False
+            del self._loaded[name]
+
+        print(f"Unloading model '{name}'", file=sys.stderr)
+        del loaded
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        return True
+
+    def evict_idle(self):
+        """Unloads every model that has not been used for `idle_seconds`."""
+        if self.idle_seconds <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle = [name for name, loaded in self._loaded.items()
+                    if not loaded.in_use and now - loaded.last_used > self.idle_seconds]
+        for name in idle:
+            self.unload(name)
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(loaded.size_bytes for loaded in self._loaded.values())
+
+    def stats(self):
+        """Summary of resident models, used for logging and diagnostics."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "size_mb": round(loaded.size_bytes / (1024 * 1024), 1),
+                    "in_use": loaded.in_use,
+                    "idle_seconds": round(now - loaded.last_used, 1),
+                }
+                for name, loaded in self._loaded.items()
+            }
+
+    def _enforce_budget(self, incoming_bytes=0):
+        # Evict least recently used models that are not in use until we fit,
+        # together with `incoming_bytes` of a model about to be loaded.
+        if self.memory_budget_bytes <= 0:
+            return
+        while self.resident_bytes() + incoming_bytes > self.memory_budget_bytes:
+            candidates = sorted(
+                (loaded for loaded in self._loaded.values() if not loaded.in_use),
+                key=lambda loaded: loaded.last_used,
+            )
+            if not candidates:
+                print("Warning: models in use exceed the configured memory budget", file=sys.stderr)
+                return
+            self.unload(candidates[0].name)
+
+    def _start_reaper(self):
+        # Background thread so idle models are dropped even when no new request arrives.
+        if self._reaper is not None or self.idle_seconds <= 0:
+            return
+        interval = max(1.0, min(self.idle_seconds / 2, 30.0))
+
+        def reap():
+            while True:
+                time.sleep(interval)
+                self.evict_idle()
+
+        self._reaper = threading.Thread(target=reap, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Returns the process-wide registry shared by all inference code."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
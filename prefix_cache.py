@@ -0,0 +1,94 @@
+import os
+import threading
+import torch
+
+# === KV-cache reuse for static prompt prefixes ===
+# The system prompt in front of every codegen/dropdown request never changes,
+# so its attention keys/values are computed once per loaded model (and
+# adapter) and reused; only the request-specific suffix goes through prefill.
+# The cache lives on the registry's LoadedModel, so it is dropped together
+# with the model when the registry evicts it. Set ALGOMATE_PREFIX_CACHE=0 to
+# disable.
+
+PREFIX_CACHE_ENABLED = os.getenv("ALGOMATE_PREFIX_CACHE", "1") != "0"
+
+_lock = threading.Lock()
+
+
+def _to_legacy(past):
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+
+def _expand_past(past, batch_size):
+    # Fresh per-call copy, repeated along the batch dimension; generate()
+    # mutates cache objects in place so the stored one must never be passed.
+    legacy = _to_legacy(past)
+    expanded = tuple(
+        tuple(t.repeat(batch_size, *([1] * (t.dim() - 1))) for t in layer)
+        for layer in legacy
+    )
+    if hasattr(past, "to_legacy_cache"):
+        return type(past).from_legacy_cache(expanded)
+    return expanded
+
+
+def get_prefix_state(loaded, prefix):
+    """Returns (prefix_ids, past_key_values) for `prefix`, computing them on first use."""
+    with _lock:
+        cache = loaded.prefix_cache
+        if prefix not in cache:
+            prefix_ids = loaded.tokenizer(prefix, return_tensors="pt").input_ids.to(loaded.device)
+            with torch.no_grad():
+                out = loaded.model(input_ids=prefix_ids, use_cache=True)
+            cache[prefix] = (prefix_ids, out.past_key_values)
+        return cache[prefix]
+
+
+def splits_cleanly(tokenizer, prefix, suffixes):
+    """True if ids(prefix) + ids(suffix) == ids(prefix + suffix) for every suffix."""
+    prefix_ids = tokenizer(prefix).input_ids
+    suffix_ids = tokenizer(list(suffixes), add_special_tokens=False).input_ids
+    full_ids = tokenizer([prefix + suffix for suffix in suffixes]).input_ids
+    return all(prefix_ids + ids == full for ids, full in zip(suffix_ids, full_ids))
+
+
+def build_inputs(loaded, prefix, suffixes, num_return_sequences=1, reuse_prefix=True):
+    """
+    Builds `generate` keyword arguments for `prefix + suffix` for every suffix.
+
+    With the cache enabled the prefix tokens are followed by the left-padded
+    suffixes and the stored past-key-values are passed in, so generate() only
+    prefills the suffix. The attention mask hides the padding between the
+    two, and position ids are derived from it, so positions stay contiguous.
+    Pass reuse_prefix=False for plain inputs, e.g. for assisted generation,
+    whose draft model cannot share the verifier's cache. The prefix's
+    trailing whitespace is moved into the suffixes, and the cache is skipped
+    if BPE would still merge across the prefix/suffix join, i.e. when
+    tokenizing the two halves separately would give different tokens than
+    tokenizing the full prompt.
+    """
+    tokenizer, device = loaded.tokenizer, loaded.device
+    # Trailing whitespace merges with whatever follows it, so it travels with
+    # the suffixes; the cached part then ends on a pre-tokenizer boundary
+    head = prefix.rstrip()
+    suffixes = [prefix[len(head):] + suffix for suffix in suffixes]
+    prefix = head
+    if not (PREFIX_CACHE_ENABLED and reuse_prefix and splits_cleanly(tokenizer, prefix, suffixes)):
+        inputs = tokenizer([prefix + suffix for suffix in suffixes], return_tensors="pt", padding=True).to(device)
+        return dict(inputs)
+
+    prefix_ids, past = get_prefix_state(loaded, prefix)
+    suffix_inputs = tokenizer(suffixes, return_tensors="pt", padding=True, add_special_tokens=False).to(device)
+    batch_size = len(suffixes)
+
+    input_ids = torch.cat([prefix_ids.expand(batch_size, -1), suffix_inputs["input_ids"]], dim=1)
+    attention_mask = torch.cat([
+        torch.ones((batch_size, prefix_ids.shape[1]), dtype=suffix_inputs["attention_mask"].dtype, device=device),
+        suffix_inputs["attention_mask"],
+    ], dim=1)
+    return {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        # generate() expands inputs for num_return_sequences but not the cache
+        "past_key_values": _expand_past(past, batch_size * num_return_sequences),
+    }
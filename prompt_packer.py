@@ -0,0 +1,62 @@
+# === Token-budget prompt packing ===
+# Retrieved examples are added to a prompt best-match first until a token
+# budget is spent. An example that does not fit whole is cut short (its
+# output is truncated) when at least MIN_EXAMPLE_TOKENS of it would remain;
+# otherwise it is dropped. The local SLMs count with their own tokenizer;
+# Gemini prompts use a character estimate, since exact counts would cost an
+# extra API round trip per request.
+
+MIN_EXAMPLE_TOKENS = 48
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Rough token count for BPE vocabularies (about four characters per token)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_chars(text, max_tokens):
+    return text[:max(0, max_tokens) * CHARS_PER_TOKEN]
+
+
+def tokenizer_counter(tokenizer):
+    """(count_tokens, truncate) functions backed by a Hugging Face tokenizer."""
+
+    def count_tokens(text):
+        return len(tokenizer(text, add_special_tokens=False).input_ids)
+
+    def truncate(text, max_tokens):
+        ids = tokenizer(text, add_special_tokens=False).input_ids
+        return tokenizer.decode(ids[:max(0, max_tokens)])
+
+    return count_tokens, truncate
+
+
+def pack_examples(samples, render, budget, count_tokens=estimate_tokens, truncate=truncate_chars,
+                  min_tokens=MIN_EXAMPLE_TOKENS, output_key="output"):
+    """
+    Fits `samples` (most similar first) into `budget` tokens.
+
+    `render(index, sample, output)` formats one example; the output (the
+    sample's `output_key` field) is passed separately so it can be truncated.
+    Returns the rendered examples and the samples they came from.
+    """
+    texts, used_samples, used = [], [], 0
+    for sample in samples:
+        index = len(texts)
+        output = sample.get(output_key, "")
+        text = render(index, sample, output)
+        cost = count_tokens(text)
+        if used + cost > budget:
+            # Keep the instruction and as much of the output as still fits
+            room = budget - used - count_tokens(render(index, sample, ""))
+            if room < min_tokens:
+                continue
+            text = render(index, sample, truncate(output, room))
+            cost = count_tokens(text)
+            if used + cost > budget:
+                continue
+        texts.append(text)
+        used_samples.append(sample)
+        used += cost
+    return texts, used_samples
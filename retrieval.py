@@ -0,0 +1,225 @@
+import sys
+import json
+import os
+
+# === Retrieval helpers shared by the Gemini scripts ===
+# Heavy dependencies (numpy, sentence_transformers) are imported on first use
+# so that scripts can answer requests that need no retrieval without paying
+# for them at startup. Sample embeddings live in the memory-mapped store that
+# create_embeddings.py writes (embedding_store.py); a vector_samples.jsonl from
+# older builds is still read if no store exists.
+#
+# Retrieval is a cascade: a BM25 lexical top-N (the store's lexical index)
+# picks ALGOMATE_RETRIEVAL_CANDIDATES candidates, and only those are reranked
+# by cosine similarity of the MiniLM embeddings, so the dense stage costs
+# O(N) however large the corpus grows. Stores no larger than N go straight
+# to the dense index, which also tops up queries whose candidates yield fewer
+# than top_n matches above the threshold.
+# ALGOMATE_RETRIEVAL_CANDIDATES=0 disables the lexical stage.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VECTOR_STORE_DIR = os.path.join(SCRIPT_DIR, "data", "vector_store")
+VECTOR_SAMPLES_FILE = os.path.join(SCRIPT_DIR, "data", "vector_samples.jsonl")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+CASCADE_CANDIDATES = int(os.getenv("ALGOMATE_RETRIEVAL_CANDIDATES", "200"))
+SIMILARITY_THRESHOLD = float(os.getenv("ALGOMATE_RETRIEVAL_THRESHOLD", "0.5"))
+
+_embedding_model = None
+_samples_cache = {}
+_query_cache = None
+
+
+def get_embedding_model():
+    """Builds the SentenceTransformer the first time it is needed."""
+    global _embedding_model
+    if _embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _embedding_model
+
+
+def encode_queries(texts, model=None, batch_size=32):
+    """
+    Normalised embeddings for `texts`. With the default model, repeated texts
+    come from the query-embedding cache (embedding_cache.py) and the model is
+    only loaded when something actually has to be encoded.
+    """
+    if model is not None:
+        return model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True)
+
+    global _query_cache
+    if _query_cache is None:
+        from embedding_cache import QueryEmbeddingCache
+        _query_cache = QueryEmbeddingCache()
+    return _query_cache.encode(
+        EMBEDDING_MODEL_NAME, list(texts),
+        lambda misses: get_embedding_model().encode(misses, batch_size=batch_size, normalize_embeddings=True),
+    )
+
+
+def query_cache_stats():
+    """Hit/miss counters of the query-embedding cache (None before first use)."""
+    return _query_cache.stats() if _query_cache is not None else None
+
+
+def load_samples(filepath):
+    """Loads instructions and outputs from a .jsonl file."""
+    samples = []
+    if not os.path.exists(filepath):
+        # Print the exact path being checked for debugging
+        print(f"Warning: Samples file not found at {filepath}. No context will be injected.", file=sys.stderr)
+        return samples
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                samples.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON from line: {line.strip()} - {e}", file=sys.stderr)
+    return samples
+
+
+def get_samples(filepath=VECTOR_STORE_DIR):
+    """Opens the embedding store at `filepath` once per process and returns it afterwards."""
+    if filepath not in _samples_cache:
+        from embedding_store import EmbeddingStore
+        if os.path.isdir(filepath):
+            store = EmbeddingStore.open(filepath)
+        else:
+            # Legacy JSON embeddings: parsed once into an in-memory store
+            legacy_file = VECTOR_SAMPLES_FILE if filepath == VECTOR_STORE_DIR else filepath
+            store = EmbeddingStore.from_samples(load_samples(legacy_file))
+        _samples_cache[filepath] = store
+    return _samples_cache[filepath]
+
+
+def cascade_search(user_instruction, query, samples, top_n, threshold, nprobe=None, candidates=None):
+    """
+    [(row, score), ...] for one query: dense rerank of the lexical top
+    `candidates`, topped up from the dense index when fewer than `top_n` of
+    them reach `threshold`, or a plain dense search when the cascade does
+    not apply.
+    """
+    candidates = CASCADE_CANDIDATES if candidates is None else candidates
+    if candidates and len(samples) > candidates:
+        rows = [row for row, _ in samples.lexical.search(user_instruction, candidates)]
+        hits = samples.rerank(query, rows, top_n, threshold) if rows else []
+        if len(hits) < top_n:
+            # Too few lexical candidates clear the threshold: fill up from the dense index
+            hits = top_up(hits, samples.search(query, top_n, threshold, nprobe=nprobe), top_n)
+        return hits
+    return samples.search(query, top_n, threshold, nprobe=nprobe)
+
+
+def top_up(hits, extra, top_n):
+    """The best `top_n` of `hits` plus the rows of `extra` not already in them."""
+    seen = {row for row, _ in hits}
+    hits = hits + [hit for hit in extra if hit[0] not in seen]
+    return sorted(hits, key=lambda hit: -hit[1])[:top_n]
+
+
+def rerank_samples(user_instruction, samples, top_n=5, threshold=None, store=None, model=None):
+    """
+    The `top_n` of a small candidate list of sample dicts most similar to
+    the instruction, best first. Candidates are scored against their
+    precomputed rows of `store` (the vector store by default), matched by
+    content hash; candidates the store has no row for are skipped.
+    """
+    if not samples:
+        return []
+    store = get_samples() if store is None else store
+    by_row = {row: sample for row, sample in zip(store.rows_for(samples), samples) if row is not None}
+    if not by_row:
+        return []
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+    query = encode_queries([user_instruction], model)[0]
+    return [by_row[row] for row, _ in store.rerank(query, list(by_row), top_n, threshold)]
+
+
+def find_matching_samples(user_instruction, samples, model=None, top_n=5, threshold=None, nprobe=None, candidates=None):
+    """
+    Finds the top-N samples most similar to the user's instruction
+    using cosine similarity of precomputed embeddings.
+
+    Only returns samples with similarity >= `threshold`.
+
+    Parameters:
+        user_instruction (str): The input prompt or query.
+        samples: EmbeddingStore from get_samples (or a list of dicts with 'embedding' keys).
+        model: SentenceTransformer or similar embedding model (defaults to MiniLM).
+        top_n (int): Max number of similar samples to return.
+        threshold (float): Minimum similarity score to accept a sample
+            (defaults to ALGOMATE_RETRIEVAL_THRESHOLD, 0.5).
+        nprobe (int): IVF clusters to scan; higher is slower but closer to exact
+            (defaults to ALGOMATE_ANN_NPROBE, ignored for flat indexes).
+        candidates (int): Lexical candidates reranked by the embeddings
+            (defaults to ALGOMATE_RETRIEVAL_CANDIDATES; 0 scores the whole store).
+    """
+    from embedding_store import EmbeddingStore
+
+    if not isinstance(samples, EmbeddingStore):
+        samples = EmbeddingStore.from_samples(samples)
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+
+    # Encode only the user instruction (or reuse its cached vector); the sample
+    # matrix is precomputed and memory-mapped
+    user_embedding = encode_queries([user_instruction], model)[0]
+    hits = cascade_search(user_instruction, user_embedding, samples, top_n, threshold, nprobe, candidates)
+    return [samples.sample(index) for index, _ in hits]
+
+
+def find_matching_samples_batch(instructions, samples, model=None, top_n=5, threshold=None, nprobe=None,
+                                candidates=None, batch_size=64):
+    """
+    find_matching_samples for many instructions at once: one batched encode,
+    then either one matrix product against the store or, with the cascade,
+    one matrix product against the instructions' lexical candidates. Returns
+    one list of samples per instruction, in order.
+    """
+    import numpy as np
+    from embedding_store import EmbeddingStore
+
+    if not isinstance(samples, EmbeddingStore):
+        samples = EmbeddingStore.from_samples(samples)
+    if not instructions:
+        return []
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+    candidates = CASCADE_CANDIDATES if candidates is None else candidates
+
+    embeddings = np.asarray(encode_queries(instructions, model, batch_size=batch_size))
+    if candidates and len(samples) > candidates:
+        # Lexical candidates per instruction, then one batched rerank and one
+        # batched top-up for the instructions left short (cascade_search per row)
+        row_lists = [[row for row, _ in samples.lexical.search(instruction, candidates)] for instruction in instructions]
+        results = samples.rerank_batch(embeddings, row_lists, top_n, threshold)
+        short = [i for i, hits in enumerate(results) if len(hits) < top_n]
+        if short:
+            extra = samples.search_batch(embeddings[short], top_n, threshold, nprobe=nprobe)
+            for i, hits in zip(short, extra):
+                results[i] = top_up(results[i], hits, top_n)
+    else:
+        results = samples.search_batch(embeddings, top_n, threshold, nprobe=nprobe)
+    return [[samples.sample(index) for index, _ in hits] for hits in results]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Retrieve context samples for many instructions (one per line).")
+    parser.add_argument("queries", help="Text file with one instruction per line")
+    parser.add_argument("--store", default=VECTOR_STORE_DIR)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument("--candidates", type=int, default=CASCADE_CANDIDATES,
+                        help="Lexical candidates to rerank (0: dense search over the whole store)")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        instructions = [line.strip() for line in f if line.strip()]
+    matches = find_matching_samples_batch(instructions, get_samples(args.store), top_n=args.top_n,
+                                          threshold=args.threshold, candidates=args.candidates)
+    for instruction, samples in zip(instructions, matches):
+        print(json.dumps({"instruction": instruction, "matches": samples}))
+
+
+if __name__ == "__main__":
+    main()
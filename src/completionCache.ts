@@ -0,0 +1,135 @@
+type CacheEntry<T> = {
+    value: T;
+    expires: number;
+};
+
+export type CacheStats = {
+    hits: number;
+    misses: number;
+    size: number;
+};
+
+/**
+ * Decides whether a cached value still applies after the user typed `typed`
+ * past the cached prefix, and returns what to show now (or undefined).
+ */
+export type TypeThrough<T> = (value: T, typed: string) => T | undefined;
+
+/** Keys are capped so whole-document dropdown prompts stay cheap to hash. */
+const MAX_KEY_LENGTH = 4096;
+
+export function normalizePrefix(prefix: string): string {
+    return prefix.replace(/\r\n/g, '\n');
+}
+
+/**
+ * LRU + TTL cache of backend completions keyed by model and normalized prefix.
+ * A lookup also tries the prefixes the user has typed through (up to
+ * `maxTypeAhead` characters back), so typing along a cached suggestion is
+ * served locally instead of going to the backend again.
+ */
+export class CompletionCache<T> {
+    // Map iteration order doubles as recency order: oldest entry first
+    private readonly entries = new Map<string, CacheEntry<T>>();
+    private hits = 0;
+    private misses = 0;
+
+    constructor(
+        private maxEntries: number,
+        private ttlMs: number,
+        private readonly maxTypeAhead = 64,
+    ) {}
+
+    configure(maxEntries: number, ttlMs: number): void {
+        this.maxEntries = maxEntries;
+        this.ttlMs = ttlMs;
+        this.evict();
+    }
+
+    get(model: string, prefix: string, typeThrough: TypeThrough<T>): T | undefined {
+        const normalized = normalizePrefix(prefix);
+        const limit = Math.min(this.maxTypeAhead, normalized.length);
+        for (let typedLength = 0; typedLength <= limit; typedLength++) {
+            const key = this.key(model, normalized.slice(0, normalized.length - typedLength));
+            const entry = this.live(key);
+            if (!entry) {
+                continue;
+            }
+            const value = typeThrough(entry.value, normalized.slice(normalized.length - typedLength));
+            if (value !== undefined) {
+                // Refresh recency
+                this.entries.delete(key);
+                this.entries.set(key, entry);
+                this.hits++;
+                return value;
+            }
+        }
+        this.misses++;
+        return undefined;
+    }
+
+    set(model: string, prefix: string, value: T): void {
+        if (this.maxEntries <= 0) {
+            return;
+        }
+        const key = this.key(model, normalizePrefix(prefix));
+        this.entries.delete(key);
+        this.entries.set(key, { value, expires: Date.now() + this.ttlMs });
+        this.evict();
+    }
+
+    clear(): void {
+        this.entries.clear();
+    }
+
+    stats(): CacheStats {
+        return { hits: this.hits, misses: this.misses, size: this.entries.size };
+    }
+
+    private key(model: string, prefix: string): string {
+        const tail = prefix.length > MAX_KEY_LENGTH ? prefix.slice(-MAX_KEY_LENGTH) : prefix;
+        return `${model}\u0000${tail}`;
+    }
+
+    private live(key: string): CacheEntry<T> | undefined {
+        const entry = this.entries.get(key);
+        if (entry && entry.expires <= Date.now()) {
+            this.entries.delete(key);
+            return undefined;
+        }
+        return entry;
+    }
+
+    private evict(): void {
+        while (this.entries.size > Math.max(0, this.maxEntries)) {
+            const oldest = this.entries.keys().next().value as string;
+            this.entries.delete(oldest);
+        }
+    }
+}
+
+/** Inline completions: the rest of a cached suggestion the user is typing along. */
+export const typeThroughText: TypeThrough<string> = (value, typed) => {
+    if (!typed) {
+        return value;
+    }
+    return value.startsWith(typed) && value.length > typed.length ? value.slice(typed.length) : undefined;
+};
+
+/**
+ * Dropdown suggestions replace the word at the cursor, so while the user keeps
+ * typing word characters the cached list still applies, narrowed to the
+ * suggestions that start with the word typed so far.
+ */
+export function typeThroughSuggestions(currentWord: string): TypeThrough<string[]> {
+    return (value, typed) => {
+        if (!typed) {
+            return value;
+        }
+        if (!/^\w+$/.test(typed)) {
+            return undefined;
+        }
+        const remaining = value.filter((suggestion) => suggestion.startsWith(currentWord));
+        return remaining.length ? remaining : undefined;
+    };
+}
@@ -3,6 +3,8 @@ import { getWebviewContent } from './webview';
 import { PythonShell } from 'python-shell';
 import * as path from 'path';
 import * as fs from 'fs';
+import { InferenceDaemon } from './inferenceDaemon';
+import { CompletionCache, typeThroughSuggestions, typeThroughText } from './completionCache';
 
 // function getPythonPath(): string {
 //     const venvPath = path.join(__dirname, '..', '.venv', 'bin', 'python');
@@ -16,79 +18,83 @@ function getPythonPath(): string {
     return "python"
 }
 
-async function getDropdownSuggestions(prompt: string): Promise<string[]> {
-    return new Promise((resolve) => {
-        const scriptPath = path.resolve(__dirname, '../inferenceDropDown.py');
-        const pyshell = new PythonShell(scriptPath, {
-            mode: 'json',
-            pythonPath: getPythonPath(),
-            pythonOptions: ['-u'],
-        });
+const daemons = new Map<string, InferenceDaemon>();
 
-        console.log(`[Python] Using interpreter: ${getPythonPath()}`);
-        console.log('📩 [Dropdown] Fetching dropdown suggestions for:', prompt);
-
-        pyshell.send({ prompt });
+// Completion results by model + prefix, so typing along a suggestion does not hit the backend again
+const inlineCache = new CompletionCache<string>(500, 120_000);
+const dropdownCache = new CompletionCache<string[]>(500, 120_000);
 
-        pyshell.on('message', (message) => {
-            if (message.suggestions && Array.isArray(message.suggestions)) {
-                console.log('🎯 [Dropdown] Suggestions:', message.suggestions);
-                resolve(message.suggestions);
-            } else {
-                console.error('[Dropdown] Invalid response from Python:', message);
-                resolve(['No suggestions available']);
-            }
-        });
-
-        pyshell.on('stderr', (stderr) => console.error('[Dropdown] Python stderr:', stderr));
-        pyshell.on('error', (err) => {
-            console.error('[Dropdown] Python error:', err);
-            resolve(['No suggestions available']);
-        });
-
-        pyshell.end((err) => {
-            if (err) {console.error('[Dropdown] End error:', err);}
-        });
-    });
+function configureCompletionCaches(): void {
+    const config = vscode.workspace.getConfiguration('algorandDevAssistant.completionCache');
+    const maxEntries = config.get<boolean>('enabled', true) ? config.get<number>('maxEntries', 500) : 0;
+    const ttlMs = config.get<number>('ttlSeconds', 120) * 1000;
+    inlineCache.configure(maxEntries, ttlMs);
+    dropdownCache.configure(maxEntries, ttlMs);
 }
 
-async function getInlineCompletion(prompt: string): Promise<string> {
-    return new Promise((resolve) => {
-        const scriptPath = path.resolve(__dirname, '../inferenceGhost.py');
-        const pyshell = new PythonShell(scriptPath, {
-            mode: 'json',
-            pythonPath: getPythonPath(),
-            pythonOptions: ['-u'],
-        });
-
-        console.log(`[Python] Using interpreter: ${getPythonPath()}`);
-        console.log('[Inline] Sending prefix to model:', prompt);
-
-        pyshell.send({ prompt });
-
-        pyshell.on('message', (message) => {
-            if (message.response) {
-                console.log('[Inline] Model response:', message.response);
-                resolve(message.response);
-            } else if (message.error) {
-                console.error('[Inline] Model error:', message.error);
-                resolve('');
-            } else {
-                console.error('[Inline] Unexpected response from Python:', message);
-                resolve('');
-            }
-        });
+function getDaemon(script: string, label: string): InferenceDaemon {
+    let daemon = daemons.get(script);
+    if (!daemon) {
+        daemon = new InferenceDaemon(path.resolve(__dirname, '..', script), getPythonPath(), label);
+        daemons.set(script, daemon);
+    }
+    return daemon;
+}
 
-        pyshell.on('stderr', (stderr) => console.error('[Inline] Python stderr:', stderr));
-        pyshell.on('error', (err) => {
-            console.error('[Inline] Python error:', err);
-            resolve('');
-        });
+async function getDropdownSuggestions(prompt: string, documentKey: string, token?: vscode.CancellationToken): Promise<string[]> {
+    console.log('📩 [Dropdown] Fetching dropdown suggestions for:', prompt);
+    const currentWord = /\w*$/.exec(prompt)?.[0] ?? '';
+    const cached = dropdownCache.get('dropdown', prompt, typeThroughSuggestions(currentWord));
+    if (cached) {
+        console.log('🎯 [Dropdown] Cache hit:', cached, dropdownCache.stats());
+        return cached;
+    }
+    try {
+        const message = await getDaemon('inferenceDropDown.py', 'Dropdown').request({ prompt, supersede_key: documentKey }, { token });
+        if (message.cancelled) {
+            return [];
+        }
+        if (message.suggestions && Array.isArray(message.suggestions)) {
+            console.log('🎯 [Dropdown] Suggestions:', message.suggestions);
+            dropdownCache.set('dropdown', prompt, message.suggestions);
+            return message.suggestions;
+        }
+        console.error('[Dropdown] Invalid response from Python:', message);
+        return ['No suggestions available'];
+    } catch (err) {
+        console.error('[Dropdown] Python error:', err);
+        return ['No suggestions available'];
+    }
+}
 
-        pyshell.end((err) => {
-            if (err) {console.error('[Inline] End error:', err);}
-        });
-    });
+async function getInlineCompletion(prompt: string, documentKey: string, token?: vscode.CancellationToken): Promise<string> {
+    const cached = inlineCache.get('ghost', prompt, typeThroughText);
+    if (cached !== undefined) {
+        console.log('[Inline] Cache hit:', cached, inlineCache.stats());
+        return cached;
+    }
+    console.log('[Inline] Sending prefix to model:', prompt);
+    try {
+        // A newer prefix from the same document supersedes this request in the backend
+        const message = await getDaemon('inferenceGhost.py', 'Inline').request({ prompt, supersede_key: documentKey }, { token });
+        if (message.cancelled) {
+            console.log('[Inline] Superseded by a newer prefix');
+            return '';
+        }
+        if (typeof message.response === 'string') {
+            console.log('[Inline] Model response:', message.response);
+            inlineCache.set('ghost', prompt, message.response);
+            return message.response;
+        } else if (message.error) {
+            console.error('[Inline] Model error:', message.error);
+            return '';
+        }
+        console.error('[Inline] Unexpected response from Python:', message);
+        return '';
+    } catch (err) {
+        console.error('[Inline] Python error:', err);
+        return '';
+    }
 }
 
 export function deploySmartContract(code: string, contractType: string, lang: string): Promise<string> {
@@ -122,41 +128,38 @@ export function deploySmartContract(code: string, contractType: string, lang: st
     });
 }
 
-export function callModel(prompt: string): Promise<string> {
-    return new Promise((resolve, reject) => {
-        const scriptPath = path.resolve(__dirname, '../inferenceLora.py');
-        const pyshell = new PythonShell(scriptPath, {
-            mode: 'json',
-            pythonPath: getPythonPath(),
-            pythonOptions: ['-u'],
-        });
-
-        console.log(`[Python] Using interpreter: ${getPythonPath()}`);
-
-        pyshell.send({ prompt });
-
-        pyshell.on('message', (message) => {
-            if (message.response) {
-                resolve(message.response);
-            } 
-            else if (message.error) {
-                reject(new Error(message.error));
-            } else {
-                reject(new Error("Unexpected response format from model"));
-            }
-        });
-
-        pyshell.on('stderr', (stderr) => console.error("Python stderr:", stderr));
-        pyshell.on('error', (err) => reject(err));
-        pyshell.end((err) => {
-            if (err) {reject(err);}
-        });
-    });
+export async function callModel(prompt: string, onPartial?: (text: string) => void): Promise<string> {
+    // Streams partial output through onPartial when given; resolves with the final cleaned response
+    const message = await getDaemon('inferenceLora.py', 'Model').request({ prompt, stream: !!onPartial }, { onPartial });
+    if (message.response) {
+        return message.response;
+    }
+    else if (message.error) {
+        throw new Error(message.error);
+    }
+    throw new Error("Unexpected response format from model");
 }
 
 export function activate(context: vscode.ExtensionContext) {
     console.log("[Extension] Activating Algorand Dev Assistant extension!");
 
+    configureCompletionCaches();
+    context.subscriptions.push(
+        vscode.workspace.onDidChangeConfiguration((event) => {
+            if (event.affectsConfiguration('algorandDevAssistant.completionCache')) {
+                configureCompletionCaches();
+            }
+        }),
+        vscode.commands.registerCommand('algorand-dev-assistant.showCacheStats', () => {
+            const inline = inlineCache.stats();
+            const dropdown = dropdownCache.stats();
+            vscode.window.showInformationMessage(
+                `Completion cache: inline ${inline.hits} hits / ${inline.misses} misses (${inline.size} entries), ` +
+                `dropdown ${dropdown.hits} hits / ${dropdown.misses} misses (${dropdown.size} entries)`
+            );
+        })
+    );
+
     context.subscriptions.push(
         vscode.commands.registerCommand('algorand-dev-assistant.openPanel', () => {
             const panel = vscode.window.createWebviewPanel(
@@ -176,7 +179,7 @@ export function activate(context: vscode.ExtensionContext) {
                     const prompt = `instruction: ${chat}\noutput:`;
                     vscode.window.showInformationMessage(`⏳ Generating ${lang} contract for ${chat} with purpose as ${purpose} (${type})...`);
                     try {
-                        const code = await callModel(prompt);
+                        const code = await callModel(prompt, (text) => panel.webview.postMessage({ command: 'partialOutput', text }));
                         const formattedOutput = `\`\`\`${message.lang || ''}\n${code}\n\`\`\``;
                         panel.webview.postMessage({ command: 'displayOutput', output: code });
                     } catch (err: any) {
@@ -199,7 +202,7 @@ export function activate(context: vscode.ExtensionContext) {
                     const prompt = `instruction: Improve or modify the following Python contract based on the original request.\n\noutput:\n${output}\n\nOriginal instruction: ${chat}`;
                     vscode.window.showInformationMessage(`⏳ Regenerating Python contract for ${chat}...`);
                     try {
-                        const code = await callModel(prompt);
+                        const code = await callModel(prompt, (text) => panel.webview.postMessage({ command: 'partialOutput', text }));
                         const formattedOutput = `\`\`\`${message.lang || ''}\n${code}\n\`\`\``;
                         panel.webview.postMessage({ command: 'displayOutput', output: formattedOutput });
                     } catch (err: any) {
@@ -211,12 +214,12 @@ export function activate(context: vscode.ExtensionContext) {
     );
 
     const inlineProvider: vscode.InlineCompletionItemProvider = {
-        async provideInlineCompletionItems(document, position) {
+        async provideInlineCompletionItems(document, position, context, token) {
             const linePrefix = document.lineAt(position).text.slice(0, position.character);
             console.log('[Inline] Triggered for linePrefix:', linePrefix);
             try {
-                const suggestion = await getInlineCompletion(linePrefix);
-                if (!suggestion) {return;}
+                const suggestion = await getInlineCompletion(linePrefix, document.uri.toString(), token);
+                if (!suggestion || token.isCancellationRequested) {return;}
                 return {
                     items: [
                         {
@@ -258,7 +261,10 @@ export function activate(context: vscode.ExtensionContext) {
                     const textBefore = document.getText(new vscode.Range(new vscode.Position(0, 0), position));
                     console.log('[Dropdown] Getting suggestions for textBefore:', textBefore);
 
-                    const suggestions = await getDropdownSuggestions(textBefore);
+                    const suggestions = await getDropdownSuggestions(textBefore, document.uri.toString(), token);
+                    if (token.isCancellationRequested) {
+                        return [];
+                    }
                     console.log('[Dropdown] Received suggestions:', suggestions);
 
                     return suggestions.map((sugg, index) => {
@@ -278,3 +284,10 @@ export function activate(context: vscode.ExtensionContext) {
 
     context.subscriptions.push(dropdownProvider);
 }
+
+export function deactivate() {
+    for (const daemon of daemons.values()) {
+        daemon.dispose();
+    }
+    daemons.clear();
+}
@@ -0,0 +1,140 @@
+import * as vscode from 'vscode';
+import { PythonShell } from 'python-shell';
+
+type PendingRequest = {
+    resolve: (message: any) => void;
+    reject: (err: Error) => void;
+    onPartial?: (text: string) => void;
+};
+
+export type RequestOptions = {
+    token?: vscode.CancellationToken;
+    /** Called with each `{ partial }` chunk of a streamed (`stream: true`) request. */
+    onPartial?: (text: string) => void;
+};
+
+/**
+ * Keeps one inference script running in `--server` mode and multiplexes
+ * requests over its stdin/stdout. Each request is tagged with an id that the
+ * script echoes back, so the model is only loaded once instead of per keystroke.
+ */
+export class InferenceDaemon {
+    private shell: PythonShell | undefined;
+    private nextId = 1;
+    private readonly pending = new Map<number, PendingRequest>();
+    private readonly cancelled = new Set<number>();
+
+    constructor(
+        private readonly scriptPath: string,
+        private readonly pythonPath: string,
+        private readonly label: string,
+    ) {}
+
+    /**
+     * Sends one request. When `token` fires, the backend is told to drop the
+     * request and the promise resolves with `{ cancelled: true }`. Requests that
+     * carry a `supersede_key` are also cancelled by the backend as soon as a
+     * newer request with the same key arrives.
+     */
+    request(payload: object, options: RequestOptions = {}): Promise<any> {
+        const { token, onPartial } = options;
+        if (token?.isCancellationRequested) {
+            return Promise.resolve({ cancelled: true });
+        }
+
+        const shell = this.start();
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            const subscription = token?.onCancellationRequested(() => this.cancel(id));
+            this.pending.set(id, {
+                resolve: (message) => {
+                    subscription?.dispose();
+                    resolve(message);
+                },
+                reject: (err) => {
+                    subscription?.dispose();
+                    reject(err);
+                },
+                onPartial,
+            });
+            shell.send({ ...payload, id });
+        });
+    }
+
+    cancel(id: number): void {
+        const entry = this.pending.get(id);
+        if (!entry) {
+            return;
+        }
+        this.pending.delete(id);
+        this.cancelled.add(id);
+        this.shell?.send({ cancel: id });
+        entry.resolve({ id, cancelled: true });
+    }
+
+    dispose(): void {
+        if (this.shell) {
+            this.shell.end(() => {});
+            this.shell = undefined;
+        }
+        this.failAll(new Error(`[${this.label}] Backend stopped`));
+    }
+
+    private start(): PythonShell {
+        if (this.shell) {
+            return this.shell;
+        }
+
+        console.log(`[Python] Starting ${this.label} backend with interpreter: ${this.pythonPath}`);
+        const shell = new PythonShell(this.scriptPath, {
+            mode: 'json',
+            pythonPath: this.pythonPath,
+            pythonOptions: ['-u'],
+            args: ['--server'],
+        });
+
+        shell.on('message', (message) => {
+            if (this.cancelled.has(message.id)) {
+                // Partials may still arrive after a cancel; forget the id on the final answer
+                if (typeof message.partial !== 'string') {
+                    this.cancelled.delete(message.id);
+                }
+                return;
+            }
+            const entry = this.pending.get(message.id);
+            if (!entry) {
+                console.error(`[${this.label}] Response for unknown request:`, message);
+                return;
+            }
+            if (typeof message.partial === 'string') {
+                entry.onPartial?.(message.partial);
+                return;
+            }
+            this.pending.delete(message.id);
+            entry.resolve(message);
+        });
+
+        shell.on('stderr', (stderr) => console.error(`[${this.label}] Python stderr:`, stderr));
+        shell.on('error', (err) => {
+            console.error(`[${this.label}] Python error:`, err);
+            this.failAll(err);
+        });
+        shell.on('close', () => {
+            if (this.shell === shell) {
+                this.shell = undefined;
+            }
+            this.failAll(new Error(`[${this.label}] Backend exited`));
+        });
+
+        this.shell = shell;
+        return shell;
+    }
+
+    private failAll(err: Error): void {
+        for (const entry of this.pending.values()) {
+            entry.reject(err);
+        }
+        this.pending.clear();
+        this.cancelled.clear();
+    }
+}
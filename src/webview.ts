@@ -614,10 +614,24 @@ export function getWebviewContent(webview: vscode.Webview, extensionUri: vscode.
                 });
             });
 
+           // True while streamed chunks for the current request are being appended
+           let streaming = false;
+
            window.addEventListener('message', event => {
                 const message = event.data;
                 setLoading(false);
 
+                if (message.command === 'partialOutput') {
+                    if (!streaming) {
+                        outputText.textContent = '';
+                        streaming = true;
+                    }
+                    outputText.style.display = 'block';
+                    outputText.textContent += message.text;
+                    return;
+                }
+                streaming = false;
+
                 if (message.command === 'displayOutput') {
                     outputText.style.display = 'block';
                     outputText.innerHTML = message.output;